@@ -0,0 +1,10 @@
+"""Benchmark suite for the student manager.
+
+Fills a scratch database with gen_fake_data for a number of dataset
+sizes and drives every url, importer and the main admin actions through
+the Django test client, recording wall time, query count and peak
+memory of each request.
+
+  python -m benchmarks.run --sizes 500 2000 8000
+  python -m benchmarks.report benchmarks/results/<commit>.json [OTHER.json]
+"""
@@ -0,0 +1,287 @@
+"""The benchmarked requests.
+
+Every case is one request through the test client; parameters that
+depend on the generated data (exam, group and room ids, fixture files)
+are taken from a Context built after the data set is generated.
+"""
+
+import random
+import urllib.parse
+
+from django.apps import apps
+from django.db.models import Max
+from django.urls import reverse
+
+from student_manager import models, urls
+from benchmarks import fixtures
+
+
+class Context(object):
+    """ ids and fixture files of the current data set """
+
+    def __init__(self, directory, seed=1):
+        self.directory = directory
+        self.seed = seed
+        masterexams = list(models.MasterExam.objects.order_by('number'))
+        self.exam1 = masterexams[0]
+        self.exam2 = masterexams[-1]
+        self.group = models.Group.objects.order_by('number').first()
+        self.room = models.Room.objects.filter(examnr=self.exam1) \
+                                       .order_by('priority').first()
+        self.sheet = (models.Exercise.objects.aggregate(
+            max=Max('sheet'))['max'] or 0) + 1
+        # a job in progress for the job page and its status poll
+        self.job = models.ImportJob.objects.create(
+            kind='registrations', state='running',
+            file_name='registrations.csv', rows_done=500, rows_total=2000)
+        self.files = {}
+
+    def rng(self, name):
+        """ a random generator per case, so that adding a case does not
+        change the data of the others """
+        return random.Random('%s-%s' % (self.seed, name))
+
+    def write_fixtures(self):
+        self.files = {
+            'exercises_sheet_wgrp': fixtures.exercises_sheet_wgrp(
+                self.directory, self.rng('exercises_sheet_wgrp')),
+            'exercises_exerc': fixtures.exercises_exerc(
+                self.directory, self.rng('exercises_exerc'), self.group),
+            'students': fixtures.students(
+                self.directory, self.rng('students')),
+            'exams': fixtures.exams(
+                self.directory, self.rng('exams'), self.exam2),
+            'registrations': fixtures.registrations(
+                self.directory, self.rng('registrations')),
+            'entrytests': fixtures.entrytests(
+                self.directory, self.rng('entrytests')),
+            }
+
+
+class Case(object):
+    """ one request: url name (or path) with args, method, data and an
+    optional uploaded fixture;
+    args, data and query may be functions of the Context """
+
+    def __init__(self, name, kind, url, method='get', data=None,
+                 query=None, upload=None, mutates=False, args=None):
+        self.name = name
+        self.kind = kind
+        self.url = url
+        self.args = args
+        self.method = method
+        self.data = data
+        self.query = query
+        self.upload = upload
+        self.mutates = mutates
+
+    def evaluate(self, value, ctx):
+        if callable(value):
+            return value(ctx)
+        return dict(value or {})
+
+    def request(self, client, ctx):
+        if self.url.startswith('/'):
+            path = self.url
+        else:
+            args = self.args(ctx) if callable(self.args) else self.args
+            path = reverse(self.url, args=args)
+        data = self.evaluate(self.data, ctx)
+        query = self.evaluate(self.query, ctx)
+        if query:
+            path += '?' + urllib.parse.urlencode(query)
+        if self.method=='get':
+            return client.get(path, data)
+        upload = None
+        if self.upload:
+            field, fixture = self.upload
+            upload = data[field] = open(ctx.files[fixture], 'rb')
+        try:
+            return client.post(path, data)
+        finally:
+            if upload:
+                upload.close()
+
+
+def admin_action(name, model, action, query=None):
+    """ admin action on all objects of the (filtered) changelist;
+    the admin wants one selected object even with select_across """
+    def data(ctx):
+        model_class = apps.get_model('student_manager', model)
+        return {'action': action, 'select_across': '1', 'index': '0',
+                '_selected_action': [model_class.objects.order_by('id')
+                                     .values_list('id', flat=True)[0]]}
+    return Case(name, 'admin',
+                'admin:student_manager_%s_changelist' % model,
+                method='post', data=data, query=query, mutates=True)
+
+
+def exam_results_data(ctx):
+    """ the result form of 100 exams in the first room, as submitted;
+    more would exceed DATA_UPLOAD_MAX_NUMBER_FIELDS """
+    exams = list(models.Exam.objects.filter(room=ctx.room)
+                 .order_by('id')
+                 .values_list('id', 'exam_group', 'points')[:100])
+    parts = {}
+    for exam_id, number, points in models.ExamPart.objects \
+            .filter(exam__in=[exam[0] for exam in exams]) \
+            .values_list('exam_id', 'number', 'points'):
+        parts[(exam_id, number)] = points
+    num_exercises = ctx.exam1.num_exercises
+    data = {'form-TOTAL_FORMS': str(len(exams)),
+            'form-INITIAL_FORMS': str(len(exams)),
+            'num_exercises': str(num_exercises)}
+    for i, (exam_id, exam_group, points) in enumerate(exams):
+        prefix = 'form-%d-' % i
+        data[prefix + 'id'] = str(exam_id)
+        data[prefix + 'exam_group'] = str(exam_group or '')
+        data[prefix + 'points'] = str(points or '')
+        for j in range(num_exercises):
+            part = parts.get((exam_id, j+1))
+            data[prefix + 'subpoints_%d' % j] = str(part or '')
+    return data
+
+
+def exercise_results_data(ctx):
+    """ a new sheet for the active students of the first group """
+    rng = ctx.rng('exercise_results')
+    points = [str(p) for p in models.valid_points()]
+    students = list(models.Student.objects
+                    .filter(group=ctx.group, active=True)
+                    .order_by('id').values_list('id', flat=True))
+    data = {'sheet': str(ctx.sheet), 'groups': [str(ctx.group.id)],
+            'form-TOTAL_FORMS': str(len(students)),
+            'form-INITIAL_FORMS': str(len(students))}
+    for i, student_id in enumerate(students):
+        data['form-%d-id' % i] = str(student_id)
+        data['form-%d-points' % i] = rng.choice(points)
+    return data
+
+
+def special_query(select_query):
+    return Case('query_special_%s' % select_query, 'view', 'query_special',
+                data={'select_query': select_query, 'subject_from': 'exam'})
+
+
+CASES = [
+    Case('root', 'view', '/'),
+    Case('print_exercises_opt', 'view', 'print_exercises_opt'),
+    Case('print_exercises', 'view', 'print_exercises',
+         data={'selection': 'matrikel', 'exclude': 'inactive',
+               'total': 'on', 'etest': 'on'}),
+    Case('print_exsheet_opt', 'view', 'print_exsheet_opt'),
+    Case('print_exsheet', 'view', 'print_exsheet',
+         data=lambda ctx: {'group': ctx.group.id}),
+    Case('print_students_opt', 'view', 'print_students_opt'),
+    Case('print_students', 'view', 'print_students',
+         data={'order_by': 'matrikel'}),
+    Case('print_groups_opt', 'view', 'print_groups_opt'),
+    Case('print_groups', 'view', 'print_groups', data={'matrikel': 'on'}),
+    Case('print_exams_opt', 'view', 'print_exams_opt'),
+    Case('print_exams_seats', 'view', 'print_exams',
+         data=lambda ctx: {'examnr': ctx.exam1.id, 'format': 'exam_full'}),
+    Case('print_exams_results', 'view', 'print_exams',
+         data=lambda ctx: {'examnr': ctx.exam1.id,
+                           'format': 'result_full'}),
+    Case('query_students_opt', 'view', 'query_students_opt'),
+    Case('query_students', 'view', 'query_students',
+         data={'first_field': 'subject', 'second_field': 'semester',
+               'only_active': 'on'}),
+    Case('query_exams_opt', 'view', 'query_exams_opt'),
+    Case('query_exams', 'view', 'query_exams',
+         data=lambda ctx: {'examnr': ctx.exam1.id,
+                           'query_examgroups': 'on'}),
+    Case('query_regist', 'view', 'query_regist'),
+    Case('query_new_assigned', 'view', 'query_new_assigned'),
+    Case('query_exercise', 'view', 'query_exercise'),
+    Case('query_examparts_opt', 'view', 'query_examparts_opt'),
+    Case('query_examparts', 'view', 'query_examparts',
+         data=lambda ctx: {'examnr': ctx.exam1.id}),
+    Case('query_special_opt', 'view', 'query_special_opt'),
+    special_query('exam_exercise'),
+    special_query('exam_subject'),
+    special_query('exam_first'),
+    special_query('exam_both'),
+    special_query('exam_group'),
+    special_query('exgroup_diff'),
+    Case('export_students', 'view', 'export_students', method='post',
+         data={'export_choice': 'all'}),
+    Case('export_entrytests', 'view', 'export_entrytests', method='post',
+         data={'export_choice': 'active_missing'}),
+    Case('export_examresults', 'view', 'export_examresults', method='post',
+         data=lambda ctx: {'examnr': ctx.exam1.id}),
+    Case('save_exam_results', 'view', 'save_exam_results', method='post',
+         data=exam_results_data, mutates=True),
+    Case('save_exercise_results', 'view', 'save_exercise_results',
+         method='post', data=exercise_results_data, mutates=True),
+
+    Case('import_exercises_form', 'view', 'import_exercises'),
+    Case('import_exercises_sheet_wgrp', 'import', 'import_exercises',
+         method='post', upload=('csv_file', 'exercises_sheet_wgrp'),
+         data={'format': 'sheet-wgrp', 'column_separator': ';'},
+         mutates=True),
+    Case('import_exercises_exerc', 'import', 'import_exercises',
+         method='post', upload=('csv_file', 'exercises_exerc'),
+         data=lambda ctx: {'format': 'exerc', 'group': ctx.group.id,
+                           'column_separator': ';'},
+         mutates=True),
+    Case('import_students_form', 'view', 'import_students'),
+    Case('import_students', 'import', 'import_students', method='post',
+         upload=('csv_file', 'students'), data={'column_separator': ';'},
+         mutates=True),
+    Case('import_exams_form', 'view', 'import_exams'),
+    Case('import_exams', 'import', 'import_exams', method='post',
+         upload=('csv_file', 'exams'),
+         data=lambda ctx: {'examnr': ctx.exam2.id, 'column_separator': ';'},
+         mutates=True),
+    Case('import_registrations_form', 'view', 'import_registrations'),
+    Case('import_registrations', 'import', 'import_registrations',
+         method='post', upload=('file', 'registrations'),
+         data={'csv_separator': ';', 'update_choice': 'all',
+               'import_choice': 'all'},
+         mutates=True),
+    Case('import_entrytests_form', 'view', 'import_entrytests'),
+    Case('import_entrytests', 'import', 'import_entrytests', method='post',
+         upload=('csv_file', 'entrytests'), data={'csv_separator': ';'},
+         mutates=True),
+
+    Case('import_job', 'view', 'import_job',
+         args=lambda ctx: [ctx.job.id]),
+    Case('import_job_status', 'view', 'import_job_status',
+         args=lambda ctx: [ctx.job.id]),
+
+    Case('request_metrics', 'view', 'request_metrics'),
+    Case('admin_index', 'view', 'admin:index'),
+    Case('admin_groups', 'view', 'admin:student_manager_group_changelist'),
+    Case('admin_students', 'view',
+         'admin:student_manager_student_changelist'),
+    Case('admin_exercises', 'view',
+         'admin:student_manager_exercise_changelist'),
+    Case('admin_exams', 'view', 'admin:student_manager_exam_changelist'),
+    Case('admin_examparts', 'view',
+         'admin:student_manager_exampart_changelist'),
+    Case('admin_registrations', 'view',
+         'admin:student_manager_registration_changelist'),
+    Case('admin_entrytests', 'view',
+         'admin:student_manager_entrytest_changelist'),
+    admin_action('assign_seats', 'exam',
+                 'assign_seats_sort_modulo_matrikel',
+                 query=lambda ctx: {'examnr__id__exact': ctx.exam1.id}),
+    admin_action('toggle_active', 'student', 'toggle_active'),
+    admin_action('assign_groups', 'registration', 'assign_groups',
+                 query={'status__exact': 'ZU'}),
+    admin_action('enter_results', 'exam', 'enter_results',
+                 query=lambda ctx: {'room__id__exact': ctx.room.id}),
+    admin_action('recalc_marks', 'masterexam', 'recalc_marks'),
+]
+
+
+def uncovered_urls():
+    """ names of url patterns in student_manager/urls.py without case """
+    covered = set(case.url for case in CASES)
+    names = []
+    for pattern in urls.urlpatterns:
+        name = getattr(pattern, 'name', None)
+        if name and name not in covered:
+            names.append(name)
+    return names
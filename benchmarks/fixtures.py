@@ -0,0 +1,160 @@
+"""CSV fixtures for the importers, written from the generated data set.
+
+Every fixture mixes rows the importer finds unchanged with new and
+changed rows (and a few bad ones), roughly in the proportions of a real
+upload, so that all code paths of the importers are timed.
+"""
+
+import csv
+import os
+
+from django.db.models import Max
+
+from student_manager import models
+from student_manager.management.commands.gen_fake_data import \
+    FIRST_NAMES, LAST_NAMES
+
+
+def write_csv(directory, filename, rows):
+    path = os.path.join(directory, filename)
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        csv.writer(f, delimiter=';').writerows(rows)
+    return path
+
+
+def new_matrikels(rng, count):
+    """ matrikel numbers not yet in the database """
+    used = set(models.Student.objects.values_list('matrikel', flat=True))
+    matrikels = []
+    while len(matrikels)<count:
+        matrikel = rng.randrange(100000, 1000000)
+        if matrikel not in used:
+            used.add(matrikel)
+            matrikels.append(matrikel)
+    return matrikels
+
+
+def exercises_sheet_wgrp(directory, rng):
+    """ the whole exercise table with group column plus one new sheet;
+    5% of the students get a changed entry """
+    points = [str(p) for p in models.valid_points()]
+    sheets = models.Exercise.objects.aggregate(
+        max=Max('sheet'))['max'] or 0
+    table = {}
+    for matrikel, group, sheet, p in models.Exercise.objects \
+            .values_list('student__matrikel', 'group__number',
+                         'sheet', 'points'):
+        row = table.setdefault(matrikel, [group] + ['']*(sheets+1))
+        row[sheet] = str(p)
+    rows = [['matrikel', 'group'] + [str(s) for s in range(1, sheets+2)]]
+    for matrikel in sorted(table):
+        row = table[matrikel]
+        if rng.random()<0.8:
+            row[sheets+1] = rng.choice(points)
+        if rng.random()<0.05:
+            row[rng.randint(1, sheets)] = rng.choice(points)
+        rows.append([str(matrikel)] + [str(c) for c in row])
+    rows.append([str(m) for m in new_matrikels(rng, 1)] + ['1', '1'])
+    return write_csv(directory, 'exercises_sheet_wgrp.csv', rows)
+
+
+def exercises_exerc(directory, rng, group):
+    """ one new sheet for the active students of one group """
+    points = [str(p) for p in models.valid_points()]
+    sheet = (models.Exercise.objects.aggregate(
+        max=Max('sheet'))['max'] or 0) + 1
+    rows = [['matrikel', 'sheet', 'points']]
+    for matrikel in models.Student.objects \
+            .filter(group=group, active=True).order_by('matrikel') \
+            .values_list('matrikel', flat=True):
+        rows.append([str(matrikel), str(sheet), rng.choice(points)])
+    return write_csv(directory, 'exercises_exerc.csv', rows)
+
+
+def students(directory, rng):
+    """ 10% new students, some without matrikel, plus 1% existing ones """
+    count = models.Student.objects.count()
+    groups = list(models.Group.objects.order_by('number')
+                  .values_list('number', flat=True))
+    rows = [['matrikel', 'last_name', 'first_name', 'subject',
+             'semester', 'group']]
+    for matrikel in new_matrikels(rng, count // 10):
+        rows.append([str(matrikel), rng.choice(LAST_NAMES),
+                     rng.choice(FIRST_NAMES), 'ET', str(rng.randint(1, 6)),
+                     str(rng.choice(groups)) if groups else ''])
+    for i in range(count // 200 + 1):
+        rows.append(['', rng.choice(LAST_NAMES), rng.choice(FIRST_NAMES),
+                     'Info', '', ''])
+    existing = list(models.Student.objects.exclude(matrikel=None)
+                    .order_by('matrikel')
+                    .values_list('matrikel', flat=True))
+    for matrikel in rng.sample(existing, min(len(existing),
+                                             count // 100 + 1)):
+        rows.append([str(matrikel), 'Existing', 'Student', 'IT', '1', ''])
+    return write_csv(directory, 'students.csv', rows)
+
+
+def exams(directory, rng, masterexam):
+    """ exam registration list grouped by subject: most students are
+    registered already, 10% are new students, some change resit """
+    rows = []
+    registered = list(models.Exam.objects.filter(examnr=masterexam)
+                      .order_by('student__matrikel')
+                      .values_list('student__matrikel', 'student__last_name',
+                                   'student__first_name', 'subject',
+                                   'resit'))
+    by_subject = {}
+    for matrikel, last_name, first_name, subject, resit in registered:
+        if rng.random()<0.05:
+            resit = rng.choice((None, 1, 2))
+        by_subject.setdefault(subject, []).append(
+            (matrikel, last_name, first_name, resit))
+    for matrikel in new_matrikels(rng, len(registered) // 10 + 1):
+        by_subject.setdefault('ET', []).append(
+            (matrikel, rng.choice(LAST_NAMES), rng.choice(FIRST_NAMES),
+             None))
+    for subject in sorted(by_subject):
+        rows.append(['subject: %s' % subject])
+        for nr, (matrikel, last_name, first_name, resit) \
+                in enumerate(by_subject[subject], 1):
+            rows.append([str(nr), last_name, first_name, str(matrikel),
+                         '' if resit is None else str(resit)])
+        rows.append([])
+    rows.append(['x', 'broken', 'line'])
+    return write_csv(directory, 'exams.csv', rows)
+
+
+def registrations(directory, rng):
+    """ registration export with 1-3 group wishes per student:
+    all current students plus 10% new ones """
+    groups = list(models.Group.objects.order_by('number')
+                  .values_list('time', flat=True))
+    students = list(models.Student.objects.exclude(matrikel=None)
+                    .order_by('matrikel')
+                    .values_list('matrikel', 'last_name', 'first_name',
+                                 'subject', 'semester'))
+    for matrikel in new_matrikels(rng, len(students) // 10 + 1):
+        students.append((matrikel, rng.choice(LAST_NAMES),
+                         rng.choice(FIRST_NAMES), 'ET', 1))
+    rows = [['Matrikel', 'Name', 'Vorname', '', 'Studiengang', '',
+             'Semester', 'Status', 'Prioritaet', 'Gruppe']]
+    for matrikel, last_name, first_name, subject, semester in students:
+        wishes = rng.sample(groups, min(len(groups), rng.randint(1, 3)))
+        for priority, group in enumerate(wishes, 1):
+            rows.append([str(matrikel), last_name, first_name, '',
+                         subject, '', str(semester or ''),
+                         'ZU' if priority==1 else 'AN', str(priority),
+                         group])
+    return write_csv(directory, 'registrations.csv', rows)
+
+
+def entrytests(directory, rng):
+    """ entry test results for all students with a group """
+    rows = [['matrikel', 'result']]
+    for matrikel in models.Student.objects.exclude(group=None) \
+            .order_by('matrikel').values_list('matrikel', flat=True):
+        rows.append([str(matrikel),
+                     rng.choice(('bestanden', 'bestanden', 'bestanden',
+                                 'nicht bestanden', '-'))])
+    rows.append(['xyz', 'bestanden'])
+    return write_csv(directory, 'entrytests.csv', rows)
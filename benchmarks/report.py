@@ -0,0 +1,133 @@
+"""Scaling-curve report of benchmark results.
+
+  python -m benchmarks.report RESULTS.json            # scaling curves
+  python -m benchmarks.report OLD.json NEW.json       # compare two runs
+  python -m benchmarks.report RESULTS.json --csv      # for spreadsheets
+
+The scaling report lists wall time, queries and peak memory of every
+case per data set size together with the growth exponent between the
+smallest and the largest size: about 1 means linear, above 1 worse than
+linear; a query count growing with the size points to N+1 queries.
+"""
+
+import argparse
+import csv
+import json
+import math
+import sys
+
+
+def load(filename):
+    with open(filename) as f:
+        data = json.load(f)
+    table = {}                          # case -> {size: result}
+    for result in data['results']:
+        table.setdefault(result['case'], {})[result['size']] = result
+    return data, table
+
+
+def exponent(results, key):
+    """ growth exponent of the value between smallest and largest size """
+    points = [(size, r.get(key)) for size, r in sorted(results.items())
+              if r.get(key)]
+    if len(points)<2:
+        return None
+    (s0, v0), (s1, v1) = points[0], points[-1]
+    if s0==s1 or v0<=0 or v1<=0:
+        return None
+    return math.log(v1 / v0) / math.log(s1 / s0)
+
+
+def format_value(value, fmt):
+    if value is None:
+        return '-'
+    return fmt % value
+
+
+def scaling(data, table, out):
+    sizes = data['sizes']
+    out.write('commit %s, %s, python %s, django %s, %s\n\n'
+              % (data['commit'], data['date'], data['python'],
+                 data['django'], data['database']))
+    for key, title, fmt in (('wall_ms', 'wall time [ms]', '%.1f'),
+                            ('queries', 'queries', '%d'),
+                            ('peak_kb', 'peak memory [KiB]', '%.0f')):
+        out.write('%-32s' % title)
+        out.write(''.join('%11d' % size for size in sizes))
+        out.write('%8s\n' % 'exp')
+        for case, results in table.items():
+            out.write('%-32s' % case)
+            for size in sizes:
+                result = results.get(size, {})
+                if 'error' in result:
+                    out.write('%11s' % 'ERROR')
+                else:
+                    out.write('%11s' % format_value(result.get(key), fmt))
+            out.write('%8s\n' % format_value(exponent(results, key),
+                                             '%.2f'))
+        out.write('\n')
+    errors = [(case, size, r['error']) for case, results in table.items()
+              for size, r in results.items() if 'error' in r]
+    for case, size, error in errors:
+        out.write('error %s (size %d): %s\n' % (case, size, error))
+
+
+def compare(old_data, old, new_data, new, out):
+    out.write('%s -> %s: ratio new/old of wall time (queries)\n\n'
+              % (old_data['commit'], new_data['commit']))
+    sizes = [s for s in new_data['sizes'] if s in old_data['sizes']]
+    if not sizes:
+        out.write('no common data set sizes\n')
+        return
+    out.write('%-32s' % 'case')
+    out.write(''.join('%18d' % size for size in sizes) + '\n')
+    for case, results in new.items():
+        if case not in old:
+            continue
+        out.write('%-32s' % case)
+        for size in sizes:
+            r0 = old[case].get(size, {})
+            r1 = results.get(size, {})
+            if not r0.get('wall_ms') or not r1.get('wall_ms'):
+                out.write('%18s' % '-')
+                continue
+            out.write('%18s' % ('%.2f (%d->%d)'
+                                % (r1['wall_ms'] / r0['wall_ms'],
+                                   r0['queries'], r1['queries'])))
+        out.write('\n')
+
+
+def write_csv(table, out):
+    writer = csv.writer(out)
+    writer.writerow(['case', 'kind', 'size', 'wall_ms', 'queries',
+                     'peak_kb', 'error'])
+    for case, results in table.items():
+        for size, r in sorted(results.items()):
+            writer.writerow([case, r['kind'], size, r.get('wall_ms'),
+                             r.get('queries'), r.get('peak_kb'),
+                             r.get('error', '')])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Report or compare benchmark results.')
+    parser.add_argument('results', nargs='+', metavar='RESULTS.json',
+                        help='one result file, or two to compare')
+    parser.add_argument('--csv', action='store_true',
+                        help='write the (last) results as csv')
+    args = parser.parse_args(argv)
+    if len(args.results)>2:
+        parser.error('at most two result files')
+
+    data, table = load(args.results[-1])
+    if args.csv:
+        write_csv(table, sys.stdout)
+    elif len(args.results)==2:
+        old_data, old = load(args.results[0])
+        compare(old_data, old, data, table, sys.stdout)
+    else:
+        scaling(data, table, sys.stdout)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,247 @@
+"""Run the benchmark cases against generated data sets.
+
+  python -m benchmarks.run [--sizes 500 2000 8000] [--repeat 3]
+                           [--case NAME ...] [--output FILE]
+
+For every size (number of students) the scratch database is filled with
+gen_fake_data and every case is requested through the test client.
+Cases that change data run on a fresh copy of the database each time.
+The results (best wall time, query count, peak traced memory) are
+written as JSON, by default to benchmarks/results/<commit>.json.
+"""
+
+import argparse
+import datetime
+import gc
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+
+import django
+
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           'results')
+
+
+def git_commit():
+    try:
+        commit = subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            stderr=subprocess.DEVNULL, text=True).strip()
+        dirty = subprocess.check_output(
+            ['git', 'status', '--porcelain', '--untracked-files=no'],
+            stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return commit + ('-dirty' if dirty else '')
+
+
+def consume(response):
+    """ read the whole response, streamed or not """
+    if response.streaming:
+        return sum(len(chunk) for chunk in response.streaming_content)
+    return len(response.content)
+
+
+class Runner(object):
+
+    def __init__(self, repeat, seed, verbose):
+        from django.contrib.auth.models import User
+        from django.db import connection
+        from django.test import Client
+
+        self.repeat = repeat
+        self.seed = seed
+        self.verbose = verbose
+        self.connection = connection
+        self.db_name = connection.settings_dict['NAME']
+        self.snapshot = self.db_name + '.snapshot'
+        self.workdir = tempfile.mkdtemp(prefix='student_manager_bench_')
+        self.client = Client()
+        self.user_model = User
+
+    def prepare(self, size):
+        """ generate the data set, the fixtures and a snapshot of the
+        database to restore before every changing request """
+        from django.core.management import call_command
+        from benchmarks.cases import Context
+
+        self.restore_cache()
+        with open(os.devnull, 'w') as devnull:
+            call_command('gen_fake_data', clear=True, students=size,
+                         groups=max(2, size // 75),
+                         rooms=max(2, size // 250), sheets=12, exams=2,
+                         parts=6, seed=self.seed, stdout=devnull)
+        user, created = self.user_model.objects.get_or_create(
+            username='benchmark',
+            defaults={'is_staff': True, 'is_superuser': True})
+        self.client.force_login(user)
+        ctx = Context(self.workdir, self.seed)
+        ctx.write_fixtures()
+        self.connection.close()
+        shutil.copyfile(self.db_name, self.snapshot)
+        return ctx
+
+    def restore(self):
+        self.connection.close()
+        shutil.copyfile(self.snapshot, self.db_name)
+        self.restore_cache()
+
+    def restore_cache(self):
+        from student_manager import models
+        models.static_data_cache.clear()
+
+    def measure(self, case, ctx, trace=False):
+        from django.db import reset_queries
+        from django.test.utils import CaptureQueriesContext
+
+        if case.mutates:
+            self.restore()
+        gc.collect()
+        # the query log is a bounded deque; a full one would hide the
+        # queries of this request from CaptureQueriesContext
+        reset_queries()
+        if trace:
+            tracemalloc.start()
+        with CaptureQueriesContext(self.connection) as queries:
+            start = time.perf_counter()
+            response = case.request(self.client, ctx)
+            length = consume(response)
+            wall = time.perf_counter() - start
+        peak = None
+        if trace:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        return response.status_code, length, wall, len(queries), peak
+
+    def run_case(self, case, ctx, size):
+        result = {'case': case.name, 'kind': case.kind, 'size': size}
+        try:
+            # warm up template and static data caches
+            self.measure(case, ctx)
+            walls = []
+            for i in range(self.repeat):
+                status, length, wall, queries, peak = self.measure(case, ctx)
+                walls.append(wall)
+            # memory tracing slows down the request; separate run
+            peak = self.measure(case, ctx, trace=True)[4]
+        except Exception as e:
+            tracemalloc.stop()
+            result['error'] = '%s: %s' % (type(e).__name__, e)
+            return result
+        result.update({'status': status,
+                       'bytes': length,
+                       'wall_ms': round(min(walls) * 1000, 2),
+                       'wall_ms_all': [round(w * 1000, 2) for w in walls],
+                       'queries': queries,
+                       'peak_kb': round(peak / 1024, 1)})
+        if status>=400:
+            result['error'] = 'HTTP %d' % status
+        return result
+
+    def dataset(self):
+        from student_manager import models
+        counts = {}
+        for model in (models.Student, models.Group, models.Exercise,
+                      models.Exam, models.ExamPart, models.Registration,
+                      models.EntryTest):
+            counts[model._meta.model_name] = model.objects.count()
+        return counts
+
+    def run(self, sizes, cases):
+        datasets = {}
+        results = []
+        for size in sizes:
+            start = time.perf_counter()
+            ctx = self.prepare(size)
+            datasets[size] = self.dataset()
+            self.log('size %d: data generated in %.1fs %s'
+                     % (size, time.perf_counter()-start, datasets[size]))
+            for case in cases:
+                result = self.run_case(case, ctx, size)
+                results.append(result)
+                if 'error' in result:
+                    self.log('  %-32s ERROR %s'
+                             % (case.name, result['error']))
+                else:
+                    self.log('  %-32s %9.1f ms %6d queries %9.1f KiB'
+                             % (case.name, result['wall_ms'],
+                                result['queries'], result['peak_kb']))
+            if any(case.mutates for case in cases):
+                self.restore()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+        if os.path.exists(self.snapshot):
+            os.remove(self.snapshot)
+        return datasets, results
+
+    def log(self, msg):
+        if self.verbose:
+            print(msg, file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark views, importers and admin actions.')
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[500, 2000, 8000],
+                        help='numbers of students of the data sets')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='timed runs per case; the best one counts')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--case', nargs='+', metavar='NAME',
+                        help='run only these cases')
+    parser.add_argument('--output', '-o',
+                        help='JSON result file '
+                        '(default: benchmarks/results/<commit>.json)')
+    parser.add_argument('--quiet', '-q', action='store_true')
+    args = parser.parse_args(argv)
+
+    django.setup()
+    from django.core.management import call_command
+    from django.test.utils import setup_test_environment
+    from benchmarks.cases import CASES, uncovered_urls
+
+    cases = CASES
+    if args.case:
+        cases = [case for case in CASES if case.name in args.case]
+        unknown = set(args.case) - set(case.name for case in cases)
+        if unknown:
+            parser.error('unknown case(s): %s' % ', '.join(sorted(unknown)))
+    for name in uncovered_urls():
+        print('warning: no benchmark for url %s' % name, file=sys.stderr)
+
+    setup_test_environment()
+    call_command('migrate', verbosity=0)
+    runner = Runner(args.repeat, args.seed, not args.quiet)
+    datasets, results = runner.run(sorted(args.sizes), cases)
+
+    commit = git_commit()
+    output = args.output or os.path.join(RESULTS_DIR, commit + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({'commit': commit,
+                   'date': datetime.datetime.now().isoformat(
+                       timespec='seconds'),
+                   'python': platform.python_version(),
+                   'django': django.get_version(),
+                   'database': runner.connection.vendor,
+                   'repeat': args.repeat,
+                   'seed': args.seed,
+                   'sizes': sorted(args.sizes),
+                   'datasets': datasets,
+                   'results': results},
+                  f, indent=1)
+    print('results written to %s' % output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,27 @@
+"""Settings for the benchmark runs: the normal settings with a scratch
+sqlite database and without debug overhead."""
+
+import os
+import tempfile
+
+from settings import *
+
+
+DEBUG = False
+TEMPLATES[0]['OPTIONS']['debug'] = False
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ.get(
+            'BENCHMARK_DB',
+            os.path.join(tempfile.gettempdir(), 'student_manager_bench.db')),
+    }
+}
+
+# logging in the benchmark user should not take a second
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+# run the imports within the request, so the benchmark measures them
+# and not only the upload
+IMPORT_JOBS = False
@@ -86,6 +86,7 @@ SECRET_KEY = '&58!5ah+@&=g-^c-y2@0cfbu@!ue@rzrrwzjp%+i_w5g(=5+@8'
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'student_manager.metrics.RequestMetricsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -2,7 +2,8 @@
 
 from django.contrib import admin
 from django.contrib import messages
-from django.db.models import Count, Sum
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, Exists, OuterRef, Sum, Value, When
 from django.template import RequestContext
 from django.utils.translation import gettext_lazy as _
 from django.http import HttpResponseRedirect
@@ -33,8 +34,7 @@ class NonuniqueModuloMatrikelListFilter(admin.SimpleListFilter):
             return queryset
 
         if self.value() == 'nonunique':
-            duplicates = models.Student.objects.get_pure_queryset()
-            duplicates = duplicates.values('modulo_matrikel') \
+            duplicates = models.Student.objects.values('modulo_matrikel') \
                 .annotate(Count('id'))
             duplicates = duplicates.values('modulo_matrikel').order_by()
             duplicates = duplicates.filter(id__count__gt=1)
@@ -47,33 +47,31 @@ class StudentAdmin(admin.ModelAdmin):
                     'group', 'active', 'number_of_exercises', 'total_points',
                     'bonus')
     list_filter = (NonuniqueModuloMatrikelListFilter, 'active', 'group')
+    list_select_related = ('group',)
     search_fields = ('matrikel', 'last_name', 'first_name')
     form = forms.StudentForm
     actions = ('translate_subjects', 'toggle_active', 'make_no_exercs_inactive')
 
+    def get_queryset(self, request):
+        # exercise count and bonus for the list; subqueries and a join of
+        # the one-to-one entry test, so the actions can still update the
+        # query set
+        return super(StudentAdmin, self).get_queryset(request) \
+            .with_totals().with_bonus()
+
     def translate_subjects(self, request, queryset):
         subject_transl = models.StaticData.get_subject_transl()
         for (longname, shortname) in list(subject_transl.items()):
-            updateset = queryset.filter(subject=longname).values('id')
-            # .values('id') noetig; 
-            # vermutlich wegen annotation "total_points" aus
-            # StudentManager model;
-            # siehe: https://code.djangoproject.com/ticket/18580
-            updateset.update(subject=shortname)
+            queryset.filter(subject=longname).update(subject=shortname)
 
     def toggle_active(self, request, queryset):
-        make_active = list(queryset.filter(active=False) \
-            .values_list('id', flat=True))
-        update_inactive = queryset.filter(active=True).values('id')
-        update_inactive.update(active=False)
-        update_active = queryset.filter(id__in=make_active).values('id')
-        update_active.update(active=True)
+        queryset.update(active=Case(When(active=True, then=Value(False)),
+                                    default=Value(True)))
 
     def make_no_exercs_inactive(self, request, queryset):
-        make_inactive = queryset.annotate(numex=Count('exercise')) \
-                                .filter(numex=0) \
-                                .values('id')
-        make_inactive.update(active=False)
+        queryset.exclude(Exists(models.Exercise.objects
+                                .filter(student=OuterRef('pk')))) \
+                .update(active=False)
 
 
 class ExerciseAdmin(admin.ModelAdmin):
@@ -89,12 +87,45 @@ class MasterExamAdmin(admin.ModelAdmin):
     list_display = ('number', 'title', 'mark_limits', 'num_exercises',
                     'max_points', 'part_points')
     form = forms.MasterExamForm
+    actions = ('recalc_marks',)
+
+    def recalc_marks(self, request, queryset):
+        count = models.recalc_exam_marks(
+            models.Exam.objects.filter(examnr__in=queryset))
+        messages.success(request, 'Marks of %d exams changed.' % count)
 
 
 class RoomAdmin(admin.ModelAdmin):
     list_display = ('examnr', 'name', 'capacity', 'priority', 'first_seat',
-                    'seat_map')
+                    'seat_map', 'seat_count')
     list_filter = ('examnr',)
+    readonly_fields = ('seat_preview',)
+    form = forms.RoomForm
+    # seats shown by the preview, the rest is only counted
+    seat_preview_max = 50
+
+    def seat_count(self, room):
+        try:
+            seats = room.get_seat_map()
+            return len(seats) if seats is not None else None
+        except ValueError:
+            return 'invalid'
+
+    seat_count.short_description = 'seats'
+
+    def seat_preview(self, room):
+        try:
+            seats = room.get_seat_map()
+            if not seats:
+                return '-'
+        except ValueError:
+            return 'invalid seat map'
+        preview = ', '.join(str(seat)
+                            for seat in seats[:self.seat_preview_max])
+        if len(seats)>self.seat_preview_max:
+            preview += ', ... (%d more)' \
+                % (len(seats) - self.seat_preview_max)
+        return '%d seats: %s' % (len(seats), preview)
 
 
 class ExamAdmin(admin.ModelAdmin):
@@ -152,7 +183,6 @@ class ExamAdmin(admin.ModelAdmin):
                            'No rooms found for exam %s' % examnr)
             return
 
-        queryset.update(number=None)
         if sort_by=='modmatr':
              queryset = queryset.order_by('student__modulo_matrikel',
                                          'student__obscured_matrikel')
@@ -160,16 +190,44 @@ class ExamAdmin(admin.ModelAdmin):
              queryset = queryset.order_by('student__matrikel')
         elif sort_by=='fstname':
              queryset = queryset.order_by('student__first_name')
+        exams = list(queryset.only('id'))
 
+        # assign in memory; exams beyond the capacity stay in the last room
+        room_seats = {}
         (seat, maxnumber, room) = roomlist.pop(0)
-        for exam in queryset:
+        for exam in exams:
             if seat > maxnumber and roomlist:
                 (seat, maxnumber, room) = roomlist.pop(0)
             exam.number = seat
             exam.room = room
-            exam.save()
+            room_seats[room] = seat
             seat += 1
-        messages.success(request, 'Assigned %s seats' % queryset.count())
+
+        # the seat map of a room must cover all its numbers (see
+        # PrintExamsView.map_seats)
+        out_of_seats = []
+        for room, last_seat in room_seats.items():
+            seats = room.get_seat_map()
+            if room.first_seat and seats and \
+                    last_seat - room.first_seat >= len(seats):
+                out_of_seats.append(room.name)
+        if out_of_seats:
+            messages.error(request,
+                           'Not enough entries in seat map for room(s) %s'
+                           % ', '.join(out_of_seats))
+            return
+
+        try:
+            with transaction.atomic():
+                # free the numbers first, (examnr, number) is unique
+                queryset.order_by().update(number=None)
+                models.Exam.objects.bulk_update(exams, ['number', 'room'])
+        except IntegrityError:
+            messages.error(request,
+                           'Seat numbers already used by other exams of '
+                           'exam %s' % examnr)
+            return
+        messages.success(request, 'Assigned %s seats' % len(exams))
         if no_capacity:
             messages.warning(request, 'Room(s) %s with no capacity' 
                              % ', '.join(no_capacity))
@@ -291,6 +349,20 @@ class EntryTestAdmin(admin.ModelAdmin):
                      'student__first_name')
 
 
+class RequestStatsAdmin(admin.ModelAdmin):
+    list_display = ('view', 'start', 'end', 'count', 'errors',
+                    'latency_max', 'queries_max')
+    list_filter = ('view',)
+    date_hierarchy = 'end'
+
+
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'file_name', 'state', 'user', 'created',
+                    'finished', 'rows_done', 'rows_total')
+    list_filter = ('kind', 'state')
+    exclude = ('data',)
+    date_hierarchy = 'created'
+
 
 admin.site.register(models.Group, GroupAdmin)
 admin.site.register(models.Student, StudentAdmin)
@@ -302,3 +374,5 @@ admin.site.register(models.ExamPart, ExamPartAdmin)
 admin.site.register(models.StaticData, StaticDataAdmin)
 admin.site.register(models.Registration, RegistrationAdmin)
 admin.site.register(models.EntryTest, EntryTestAdmin)
+admin.site.register(models.RequestStats, RequestStatsAdmin)
+admin.site.register(models.ImportJob, ImportJobAdmin)
@@ -55,6 +55,11 @@ class StaticDataForm(forms.ModelForm):
                     raise ValueError
             except ValueError:
                 raise ValidationError('Invalid translation.')
+        elif key=='cohorts':
+            try:
+                models.parse_cohorts(value)
+            except ValueError as e:
+                raise ValidationError('Invalid cohorts: %s' % e)
         return value
 
 
@@ -78,18 +83,39 @@ class MasterExamForm(forms.ModelForm):
 
     def clean_mark_limits(self):
         mark_limits_str = self.cleaned_data['mark_limits']
-        if mark_limits_str:
-            try:
-                mark_limits = json.loads(mark_limits_str)
-                if type(mark_limits) != list:
-                    raise ValueError
-                for entry in mark_limits:
-                    if type(entry) != list or len(entry) != 2:
-                        raise ValueError
-            except ValueError:
-                raise ValidationError('Expect list of point-mark-tuples')
+        try:
+            models.parse_mark_limits(mark_limits_str)
+        except ValueError:
+            raise ValidationError('Expect list of point-mark-tuples')
         return mark_limits_str
 
+    def clean_part_points(self):
+        part_points_str = self.cleaned_data['part_points']
+        try:
+            models.parse_part_points(part_points_str)
+        except ValueError:
+            raise ValidationError('Expect list of points')
+        return part_points_str
+
+
+class RoomForm(forms.ModelForm):
+    class Meta:
+        model = models.Room
+        exclude = ()
+
+    def clean_seat_map(self):
+        seat_map_str = self.cleaned_data['seat_map']
+        try:
+            seats = models.parse_seat_map(seat_map_str)
+            # generates the seats of a spec
+            count = len(seats) if seats is not None else None
+        except ValueError:
+            raise ValidationError('Expect seat map spec "step i:n[:k[:s[:d]]] '
+                                  '..." or list of seat numbers')
+        if count==0:
+            raise ValidationError('Seat map contains no seats')
+        return seat_map_str
+
 
 class ExamForm(forms.ModelForm):
     class Meta:
@@ -239,18 +265,30 @@ class QueryExamPartsOptForm(forms.Form):
         queryset=models.MasterExam.objects.all())
 
 
+STUDENT_QUERY_FIELDS = (('subject', 'Subject'),
+                        ('semester', 'Semester'),
+                        ('group', 'Group'),
+                        ('active', 'Active'),
+                        ('bonus', 'Bonus status'),
+                        ('exam_mark', 'Exam mark'))
+
+
 class QueryStudentsOptForm(forms.Form):
     first_field = forms.ChoiceField(
-        choices=(('subject', 'Subject'),
-                 ('semester', 'Semester'),
-                 ('group', 'Group'),
-                 ('active', 'Active')))
+        label='Rows',
+        choices=STUDENT_QUERY_FIELDS)
+    further_fields = forms.MultipleChoiceField(
+        label='Further rows',
+        choices=STUDENT_QUERY_FIELDS,
+        widget=forms.CheckboxSelectMultiple,
+        required=False)
     second_field = forms.ChoiceField(
-        choices=(('none', 'None'),
-                 ('subject', 'Subject'),
-                 ('semester', 'Semester'),
-                 ('group', 'Group'),
-                 ('active', 'Active')))
+        label='Columns',
+        choices=(('none', 'None'),) + STUDENT_QUERY_FIELDS)
+    examnr = forms.ModelChoiceField(
+        label='Exam number (for exam mark)',
+        queryset=models.MasterExam.objects.all(),
+        required=False)
     only_active = forms.BooleanField(
         label=_('Include only active students'),
         initial=True,
@@ -0,0 +1,197 @@
+"""Background jobs for long imports.
+
+An import view with views.ImportJobMixin stores the uploaded file and
+the form options as ImportJob and redirects to the job page, which polls
+the job status until the import is finished and then shows its
+messages. The job table is the queue, no broker is needed: a job is
+claimed by changing its state from queued to running with one UPDATE,
+so several workers never run the same job.
+
+Queued jobs are run by a thread pool of the web server process or by a
+separate worker process: ./manage.py run_jobs
+A worker thread runs queued jobs until the queue is empty, so jobs left
+over from a restart are run with the next upload. Jobs still running
+after IMPORT_JOB_TIMEOUT were interrupted (crash or restart of their
+worker) and are set to failed when the next job is claimed.
+
+Settings (all optional):
+  IMPORT_JOBS           False: imports run within the request
+  IMPORT_JOB_THREADS    worker threads per web server process
+                        (default 1); 0: jobs are run by run_jobs only
+  IMPORT_JOB_PROGRESS   seconds between progress writes (default 1)
+  IMPORT_JOB_TIMEOUT    seconds after which a running job counts as
+                        interrupted (default 3600, None: never)
+"""
+
+import io, json, logging, threading, time, traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from student_manager import models
+
+
+logger = logging.getLogger(__name__)
+
+# job kind -> import view class (with import_file(file, options));
+# imported on first use, the views import this module
+importers = {
+    'exercises': 'student_manager.views.ImportExercisesView',
+    'registrations': 'student_manager.views.ImportRegistrationsView',
+}
+
+executor = None
+executor_lock = threading.Lock()
+
+
+def get_importer(kind):
+    return import_string(importers[kind])
+
+
+def jobs_enabled():
+    return getattr(settings, 'IMPORT_JOBS', True)
+
+
+def count_stats(stats):
+    """ number of entries per key of the import statistics """
+    counts = {}
+    for key, value in stats.items():
+        if isinstance(value, (list, dict, set)):
+            value = len(value)
+        counts[key] = value
+    return counts
+
+
+class JobMessages(list):
+    """ message storage: django.contrib.messages adds to
+    request._messages """
+    def add(self, level, message, extra_tags=''):
+        self.append([level, str(message)])
+
+
+class JobRequest(object):
+    """ the request of an import view run as job: collects the messages
+    and writes the progress to the job """
+
+    def __init__(self, job):
+        self.job = job
+        self.user = job.user
+        self._messages = JobMessages()
+        self.interval = getattr(settings, 'IMPORT_JOB_PROGRESS', 1)
+        self.last_report = 0
+        self.done = 0
+        self.total = None
+
+    def report_progress(self, done, total, stats):
+        self.done = done
+        self.total = total
+        now = time.monotonic()
+        if now - self.last_report < self.interval:
+            return
+        self.last_report = now
+        models.ImportJob.objects.filter(id=self.job.id).update(
+            rows_done=done, rows_total=total,
+            stats=json.dumps(count_stats(stats)),
+            messages=json.dumps(self._messages))
+
+
+def submit(kind, uploaded_file, options, return_url='', user=None):
+    """ store the upload as queued job and start it in a worker thread
+    (after the commit of the current transaction) """
+    job = models.ImportJob.objects.create(
+        kind=kind,
+        file_name=uploaded_file.name[:200],
+        data=uploaded_file.read(),
+        options=json.dumps(options),
+        return_url=return_url,
+        user=user if user is not None and user.is_authenticated else None)
+    if getattr(settings, 'IMPORT_JOB_THREADS', 1) > 0:
+        transaction.on_commit(lambda: get_executor().submit(work, job.id))
+    return job
+
+
+def get_executor():
+    global executor
+    with executor_lock:
+        if executor is None:
+            executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'IMPORT_JOB_THREADS', 1),
+                thread_name_prefix='import_job')
+        return executor
+
+
+def fail_stale():
+    """ set jobs running longer than IMPORT_JOB_TIMEOUT to failed;
+    returns their number """
+    timeout = getattr(settings, 'IMPORT_JOB_TIMEOUT', 3600)
+    if timeout is None:
+        return 0
+    now = timezone.now()
+    return models.ImportJob.objects \
+        .filter(state='running', started__lt=now - timedelta(seconds=timeout)) \
+        .update(state='failed', finished=now,
+                error='Job interrupted, not finished after %d seconds.'
+                % timeout)
+
+
+def claim(job_id=None):
+    """ set the oldest queued job (or the given job, if still queued)
+    to running and return it; None if there is none """
+    fail_stale()
+    queued = models.ImportJob.objects.filter(state='queued')
+    if job_id is not None:
+        queued = queued.filter(id=job_id)
+    for job_id in queued.order_by('id').values_list('id', flat=True)[:10]:
+        if models.ImportJob.objects.filter(id=job_id, state='queued') \
+                .update(state='running', started=timezone.now()):
+            return models.ImportJob.objects.get(id=job_id)
+    return None
+
+
+def run_job(job):
+    """ run the import of a claimed job and store its result """
+    request = JobRequest(job)
+    view = None
+    # static data may have been changed by another process
+    models.static_data_cache.clear()
+    try:
+        view = get_importer(job.kind)()
+        view.request = request
+        view.import_file(io.BytesIO(bytes(job.data)), job.get_options())
+    except Exception:
+        logger.exception('import job %d failed', job.id)
+        job.state = 'failed'
+        job.error = traceback.format_exc()
+    else:
+        job.state = 'done'
+        job.data = b''
+    job.finished = timezone.now()
+    job.rows_done = request.done
+    job.rows_total = request.total
+    job.messages = json.dumps(request._messages)
+    if view is not None and hasattr(view, 'stats'):
+        job.stats = json.dumps(count_stats(view.stats))
+    job.save(update_fields=['state', 'error', 'data', 'finished',
+                            'messages', 'stats', 'rows_total', 'rows_done'])
+    return job
+
+
+def work(job_id=None):
+    """ worker thread: run the given job, if nobody else took it, then
+    the other queued jobs until the queue is empty """
+    try:
+        job = claim(job_id)
+        if job is not None:
+            run_job(job)
+        job = claim()
+        while job is not None:
+            run_job(job)
+            job = claim()
+    except Exception:
+        logger.exception('import job worker failed')
+    finally:
+        connections.close_all()
@@ -0,0 +1,280 @@
+"""Generate a synthetic data set for scale tests."""
+
+import json
+import random
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+
+from student_manager import models
+
+
+LAST_NAMES = ('Müller', 'Schmidt', 'Schneider', 'Fischer', 'Weber',
+              'Meyer', 'Wagner', 'Becker', 'Schulz', 'Hoffmann', 'Koch',
+              'Richter', 'Klein', 'Wolf', 'Schröder', 'Neumann', 'Schwarz',
+              'Braun', 'Zimmermann', 'Krüger', 'Hofmann', 'Hartmann',
+              'Lange', 'Werner', 'Krause', 'Lehmann', 'Köhler', 'Maier',
+              'Yilmaz', 'Kaya', 'Nowak', 'Kowalski', 'Nguyen', 'Ivanova')
+FIRST_NAMES = ('Anna', 'Lena', 'Lea', 'Marie', 'Sophie', 'Laura', 'Julia',
+               'Sarah', 'Elif', 'Mia', 'Lukas', 'Leon', 'Jonas', 'Felix',
+               'Paul', 'Tim', 'Niklas', 'David', 'Jan', 'Max', 'Emre',
+               'Ali', 'Tobias', 'Simon', 'Finn', 'Moritz')
+# subject, weight
+SUBJECTS = (('ET', 30), ('IT', 20), ('WIng', 15), ('Kombi ET', 5),
+            ('Info', 15), ('AS', 5), ('Kombi Inf', 5), ('Kombi Phy', 5))
+DAYS = ('Mo', 'Di', 'Mi', 'Do', 'Fr')
+HOURS = ('8-10', '10-12', '12-14', '14-16', '16-18')
+MARKS = (1.0, 1.3, 1.7, 2.0, 2.3, 2.7, 3.0, 3.3, 3.7, 4.0)
+
+# tables in delete order (for --clear)
+MODELS = (models.Registration, models.EntryTest, models.ExamPart,
+          models.Exam, models.Room, models.MasterExam, models.Exercise,
+          models.Student, models.Group)
+
+
+def insert_rows(model, fields, rows):
+    """ insert the value tuples into the model's table with one
+    executemany; much faster than bulk_create for the big tables,
+    but bypasses save() and the signals """
+    db = connections[DEFAULT_DB_ALIAS]     # not the slow proxy object
+    fields = [model._meta.get_field(name) for name in fields]
+    sql = 'INSERT INTO %s (%s) VALUES (%s)' % (
+        db.ops.quote_name(model._meta.db_table),
+        ', '.join(db.ops.quote_name(f.column) for f in fields),
+        ', '.join(['%s'] * len(fields)))
+    rows = [[f.get_db_prep_save(v, db) for f, v in zip(fields, row)]
+            for row in rows]
+    with db.cursor() as cursor:
+        for i in range(0, len(rows), 5000):
+            cursor.executemany(sql, rows[i:i+5000])
+
+
+class Command(BaseCommand):
+    help = 'Fill the database with random but reproducible students, ' \
+           'groups, exercises, exams, rooms, registrations and entry tests.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=1500)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument('--sheets', type=int, default=12)
+        parser.add_argument('--exams', type=int, default=2)
+        parser.add_argument('--parts', type=int, default=6,
+                            help='exam parts per exam')
+        parser.add_argument('--rooms', type=int, default=6,
+                            help='rooms per exam')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--clear', action='store_true',
+                            help='delete all existing data first '
+                            '(static data is kept)')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        if options['clear']:
+            self.clear()
+        elif models.Student.objects.exists() or \
+                models.MasterExam.objects.exists():
+            raise CommandError('Database not empty; use --clear.')
+
+        with transaction.atomic():
+            self.make_static_data()
+            groups = self.make_groups(options['groups'])
+            students = self.make_students(options['students'], groups,
+                                          options['sheets'])
+            self.make_registrations(students, groups)
+            self.make_entrytests(students)
+            self.sheets = options['sheets']
+            for number in range(1, options['exams']+1):
+                self.make_exam(number, students, options['parts'],
+                               options['rooms'])
+
+        self.stdout.write(
+            '%d students, %d groups, %d exercises, %d exams created.'
+            % (models.Student.objects.count(),
+               models.Group.objects.count(),
+               models.Exercise.objects.count(),
+               models.Exam.objects.count()))
+
+    def clear(self):
+        # plain deletes; deleting through the ORM would send a signal
+        # for every exercise
+        with transaction.atomic(), connection.cursor() as cursor:
+            for model in MODELS:
+                cursor.execute('DELETE FROM %s' % connection.ops.quote_name(
+                    model._meta.db_table))
+
+    def make_static_data(self):
+        defaults = (('lecture', 'Synthetic Lecture'),
+                    ('bonus1', '20'),
+                    ('bonus2', '35'),
+                    ('require_etest', ''))
+        for key, value in defaults:
+            if not models.StaticData.objects.filter(key=key).exists():
+                models.StaticData.objects.create(key=key, value=value)
+
+    def make_groups(self, count):
+        groups = []
+        for number in range(1, count+1):
+            time = '%s %s Gruppe %d' % (DAYS[number % len(DAYS)],
+                                        HOURS[(number // len(DAYS))
+                                              % len(HOURS)],
+                                        number)
+            groups.append(models.Group(number=number, time=time,
+                                       assistent='Tutor %d'
+                                       % ((number+1) // 2)))
+        models.Group.objects.bulk_create(groups)
+        return list(models.Group.objects.order_by('number'))
+
+    def make_students(self, count, groups, sheets):
+        rng = self.rng
+        subjects = [s for s, w in SUBJECTS]
+        weights = [w for s, w in SUBJECTS]
+        points = list(models.valid_points())
+        matrikels = rng.sample(range(100000, 1000000), count)
+        students = []
+        exercises = {}                  # matrikel -> [(sheet, points)]
+        for matrikel in matrikels:
+            # about 10% only come to the exam: no group, no exercises
+            group = rng.choice(groups) if groups and rng.random()<0.9 \
+                else None
+            active = group is not None and rng.random()<0.85
+            skill = rng.betavariate(4, 2)
+            sheet_points = []
+            if group:
+                dropout = rng.randint(sheets//3, sheets*2) \
+                    if not active else sheets*2
+                for sheet in range(1, sheets+1):
+                    if sheet>dropout or rng.random()>0.9:
+                        continue
+                    index = round(rng.gauss(skill, 0.2) * (len(points)-1))
+                    index = min(max(index, 0), len(points)-1)
+                    sheet_points.append((sheet, points[index]))
+            exercises[matrikel] = (group, sheet_points)
+            semester = min(int(rng.expovariate(0.6)) + 1, 12)
+            students.append(models.Student(
+                matrikel=matrikel,
+                modulo_matrikel=matrikel % 10000,
+                obscured_matrikel='%04d' % (matrikel % 10000),
+                last_name=rng.choice(LAST_NAMES),
+                first_name=rng.choice(FIRST_NAMES),
+                subject=rng.choices(subjects, weights)[0],
+                semester=semester,
+                group=group,
+                active=active,
+                total_points=sum((p for s, p in sheet_points),
+                                 Decimal('0.00'))))
+        models.Student.objects.bulk_create(students, batch_size=1000)
+
+        student_ids = dict(models.Student.objects
+                           .values_list('matrikel', 'id'))
+        rows = []
+        for matrikel, (group, sheet_points) in exercises.items():
+            for sheet, p in sheet_points:
+                rows.append((student_ids[matrikel], group.id, sheet, p))
+        # total_points is already set, so the exercises need no signals
+        insert_rows(models.Exercise, ('student', 'group', 'sheet', 'points'),
+                    rows)
+        return list(models.Student.objects.select_related('group')
+                    .order_by('matrikel'))
+
+    def make_registrations(self, students, groups):
+        rng = self.rng
+        rows = []
+        for student in students:
+            if student.group_id is None:
+                continue
+            others = rng.sample(groups, min(len(groups)-1,
+                                            rng.randint(0, 3)))
+            choices = [g for g in others if g.id!=student.group_id]
+            choices.insert(rng.randint(0, len(choices)), student.group)
+            for priority, group in enumerate(choices, 1):
+                status = 'ZU' if group.id==student.group_id else 'AN'
+                rows.append((student.id, group.id, priority, status))
+        insert_rows(models.Registration,
+                    ('student', 'group', 'priority', 'status'), rows)
+
+    def make_entrytests(self, students):
+        rng = self.rng
+        etests = []
+        for student in students:
+            if student.group_id is None or rng.random()>0.8:
+                continue
+            result = 'pass' if rng.random()<0.85 else 'fail'
+            etests.append(models.EntryTest(student=student, result=result))
+        models.EntryTest.objects.bulk_create(etests, batch_size=2000)
+
+    def make_exam(self, number, students, parts, rooms):
+        rng = self.rng
+        max_points = min(10 * parts, 90)     # Exam.points: max. 99.9
+        # linear mark scale from 50% (4.0) to 95% (1.0) of max points
+        mark_limits = []
+        for i, mark in enumerate(MARKS):
+            limit = max_points * (0.95 - 0.05*i)
+            mark_limits.append([round(limit*2)/2, mark])
+        mark_limits.append([0, 5.0])
+        part_points = [max_points // parts] * parts
+        masterexam = models.MasterExam.objects.create(
+            number=number, title='Klausur %d' % number,
+            mark_limits=json.dumps(mark_limits), num_exercises=parts,
+            max_points=max_points, part_points=json.dumps(part_points))
+
+        share = 0.7 if number==1 else 0.35
+        participants = [s for s in students if rng.random()<share]
+        rng.shuffle(participants)
+
+        capacity = len(participants) // max(rooms, 1) + 1
+        room_objs = []
+        for priority in range(1, rooms+1):
+            seat_map = ''
+            if priority % 2 == 0:
+                # every second seat
+                seat_map = '2 1:%d' % (2*capacity)
+            room_objs.append(models.Room(
+                name='HS %d' % priority, examnr=masterexam,
+                capacity=capacity, priority=priority,
+                first_seat=(priority-1)*capacity + 1, seat_map=seat_map))
+        models.Room.objects.bulk_create(room_objs)
+        room_objs = list(models.Room.objects.filter(examnr=masterexam)
+                         .order_by('priority'))
+
+        max_sheet_points = models.StaticData.get_sheet_points() \
+            * max(self.sheets, 1)
+        exams = []
+        for i, student in enumerate(participants):
+            room = room_objs[i // capacity] if room_objs else None
+            # 5% registered but absent: no points
+            if rng.random()<0.05:
+                points = None
+            else:
+                skill = float(student.total_points) / max_sheet_points \
+                    + 0.2
+                points = rng.gauss(min(skill, 0.9) * max_points,
+                                   max_points/6)
+                points = Decimal(round(min(max(points, 0), max_points)*2)
+                                 / 2).quantize(Decimal('0.1'))
+            exams.append(models.Exam(
+                student=student, examnr=masterexam, subject=student.subject,
+                resit=rng.choice((None, None, None, 1, 2)),
+                points=points, room=room,
+                number=i+1 if room else None,
+                exam_group=rng.randint(1, 2)))
+        models.Exam.objects.bulk_create(exams, batch_size=2000)
+
+        rows = []
+        for exam_id, points in models.Exam.objects \
+                .filter(examnr=masterexam).exclude(points=None) \
+                .values_list('id', 'points'):
+            # split points over the parts, at most part_points each
+            rest = points
+            for part in range(1, parts+1):
+                if part==parts:
+                    p = rest
+                else:
+                    p = min(Decimal(part_points[part-1]),
+                            (rest * Decimal(rng.uniform(0.5, 1.5))
+                             / (parts-part+1)).quantize(Decimal('0.5')))
+                rest -= p
+                rows.append((exam_id, part, p.quantize(Decimal('0.1'))))
+        insert_rows(models.ExamPart, ('exam', 'number', 'points'), rows)
+
+        models.recalc_exam_marks(masterexam.exam_set.all())
@@ -0,0 +1,23 @@
+"""Recalculate the stored total points of all students."""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from student_manager import models
+
+
+class Command(BaseCommand):
+    help = 'Recalculate Student.total_points from the exercises ' \
+           'and update the exam marks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--no-marks', action='store_true',
+            help="don't recalculate exam marks")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            count = models.Student.rebuild_total_points()
+            if not options['no_marks']:
+                models.recalc_exam_marks(models.Exam.objects.all())
+        self.stdout.write('Total points of %d students recalculated.' % count)
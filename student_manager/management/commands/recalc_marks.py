@@ -0,0 +1,27 @@
+"""Recalculate mark and final mark of exams."""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from student_manager import models
+
+
+class Command(BaseCommand):
+    help = 'Recalculate mark and final mark of all exams ' \
+           '(or of the given exam numbers).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('examnr', nargs='*', type=int,
+                            help='exam number(s), default: all exams')
+
+    def handle(self, *args, **options):
+        exams = models.Exam.objects.all()
+        if options['examnr']:
+            masterexams = models.MasterExam.objects \
+                .filter(number__in=options['examnr'])
+            if len(masterexams)!=len(set(options['examnr'])):
+                raise CommandError('Unknown exam number.')
+            exams = exams.filter(examnr__in=masterexams)
+        with transaction.atomic():
+            count = models.recalc_exam_marks(exams)
+        self.stdout.write('Marks of %d exams changed.' % count)
@@ -0,0 +1,32 @@
+"""Run queued import jobs (see student_manager/jobs.py)."""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from student_manager import jobs
+
+
+class Command(BaseCommand):
+    help = 'Run queued import jobs; waits for new jobs unless --once ' \
+           'is given. Use with IMPORT_JOB_THREADS = 0 to run all imports ' \
+           'outside the web server.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='exit when the queue is empty')
+        parser.add_argument('--interval', type=float, default=2,
+                            help='seconds between queue polls (default 2)')
+
+    def handle(self, *args, **options):
+        while True:
+            job = jobs.claim()
+            if job is None:
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+                continue
+            self.stdout.write('Running job %d (%s %s)'
+                              % (job.id, job.kind, job.file_name))
+            job = jobs.run_job(job)
+            self.stdout.write('Job %d %s.' % (job.id, job.state))
@@ -0,0 +1,325 @@
+"""Request latency and SQL metrics.
+
+RequestMetricsMiddleware times every request to a view of
+student_manager/urls.py or to an admin changelist (including admin
+actions) and counts and times its SQL statements through a database
+execute wrapper. Each process keeps the last requests in a ring buffer
+and running aggregates per view, which are written to RequestStats every
+REQUEST_METRICS_INTERVAL seconds; the latency histograms of these
+aggregates can be merged to percentiles over any time range.
+
+Settings (all optional):
+  REQUEST_METRICS           False disables the middleware
+  REQUEST_METRICS_BUFFER    size of the ring buffer (default 2000)
+  REQUEST_METRICS_INTERVAL  seconds between writes (default 300)
+  REQUEST_METRICS_SLOW_SQL  slowest statements kept (default 3)
+  REQUEST_METRICS_RETENTION days RequestStats are kept (default 90),
+                            older rows are deleted with each write;
+                            None keeps them
+"""
+
+import bisect, collections, datetime, heapq, json, logging, math, \
+    threading, time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DatabaseError, connection
+from django.utils import timezone
+
+from student_manager import models
+
+
+logger = logging.getLogger(__name__)
+
+# upper bounds in ms of the latency histogram buckets, 25% apart from
+# 1ms to about 70s; one more bucket takes everything above
+LATENCY_BUCKETS = tuple(round(1.25**i, 1) for i in range(51))
+
+# stored length of the slowest statements
+SQL_LENGTH = 500
+
+RequestRecord = collections.namedtuple(
+    'RequestRecord',
+    'time view method status latency queries sql_time slowest')
+
+
+def percentile(values, p):
+    """ p-th percentile (0..100) of the sorted list, nearest rank """
+    if not values:
+        return None
+    rank = max(1, math.ceil(p / 100 * len(values)))
+    return values[min(rank, len(values)) - 1]
+
+
+def hist_percentile(hist, p, maximum=None):
+    """ p-th percentile from a LATENCY_BUCKETS histogram: the upper
+    bound of the bucket it falls into (at most the maximum) """
+    total = sum(hist)
+    if not total:
+        return None
+    rank = p / 100 * total
+    count = 0
+    for i, n in enumerate(hist):
+        count += n
+        if count>=rank and n:
+            break
+    if i<len(LATENCY_BUCKETS):
+        bound = LATENCY_BUCKETS[i]
+    else:
+        bound = maximum
+    if maximum is not None and bound is not None:
+        bound = min(bound, maximum)
+    return bound
+
+
+def keep_slowest(slowest, entries, keep):
+    """ merge (ms, sql) entries into the min-heap of the slowest """
+    for entry in entries:
+        if len(slowest)<keep:
+            heapq.heappush(slowest, entry)
+        elif entry[0]>slowest[0][0]:
+            heapq.heapreplace(slowest, entry)
+
+
+class QueryRecorder(object):
+    """ execute wrapper counting and timing the statements of one
+    request; keeps the slowest statements (without parameters) """
+
+    def __init__(self, keep):
+        self.keep = keep
+        self.count = 0
+        self.time = 0.0
+        self.slowest = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            ms = (time.perf_counter() - start) * 1000
+            self.count += 1
+            self.time += ms
+            if len(self.slowest)<self.keep or ms>self.slowest[0][0]:
+                keep_slowest(self.slowest, ((ms, sql[:SQL_LENGTH]),),
+                             self.keep)
+
+
+class ViewAggregate(object):
+    """ running aggregate of the requests to one view """
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+        self.hist = [0] * (len(LATENCY_BUCKETS)+1)
+        self.queries_sum = 0
+        self.queries_max = 0
+        self.sql_time_sum = 0.0
+        self.slowest = []
+
+    def add(self, record, keep):
+        self.count += 1
+        if record.status>=500:
+            self.errors += 1
+        self.latency_sum += record.latency
+        self.latency_max = max(self.latency_max, record.latency)
+        self.hist[bisect.bisect_left(LATENCY_BUCKETS, record.latency)] += 1
+        self.queries_sum += record.queries
+        self.queries_max = max(self.queries_max, record.queries)
+        self.sql_time_sum += record.sql_time
+        keep_slowest(self.slowest, record.slowest, keep)
+
+    def stats(self, view, start, end):
+        return models.RequestStats(
+            view=view, start=start, end=end,
+            count=self.count, errors=self.errors,
+            latency_sum=self.latency_sum, latency_max=self.latency_max,
+            latency_hist=json.dumps(self.hist),
+            queries_sum=self.queries_sum, queries_max=self.queries_max,
+            sql_time_sum=self.sql_time_sum,
+            slowest_sql=json.dumps(sorted(self.slowest, reverse=True)))
+
+
+class RequestMetrics(object):
+    """ ring buffer of the last requests of this process and running
+    aggregates per view since the last write to RequestStats """
+
+    def __init__(self, size=2000, interval=300, keep_sql=3, retention=90):
+        self.interval = interval
+        self.keep_sql = keep_sql
+        self.retention = retention
+        self.lock = threading.Lock()
+        self.records = collections.deque(maxlen=size)
+        self.reset()
+
+    def reset(self):
+        self.aggregates = {}
+        self.period_start = timezone.now()
+        self.last_write = time.monotonic()
+
+    def add(self, record):
+        with self.lock:
+            self.records.append(record)
+            aggregate = self.aggregates.get(record.view)
+            if aggregate is None:
+                aggregate = self.aggregates[record.view] = ViewAggregate()
+            aggregate.add(record, self.keep_sql)
+            if time.monotonic() - self.last_write < self.interval:
+                return
+            period = self.take_period()
+        self.write(*period)
+
+    def take_period(self):
+        period = (self.aggregates, self.period_start, timezone.now())
+        self.reset()
+        return period
+
+    def flush(self):
+        """ write the running aggregates now """
+        with self.lock:
+            period = self.take_period()
+        self.write(*period)
+
+    def write(self, aggregates, start, end):
+        """ store the aggregates of a period and delete the RequestStats
+        older than the retention """
+        if not aggregates:
+            return
+        try:
+            models.RequestStats.objects.bulk_create(
+                [aggregate.stats(view, start, end)
+                 for view, aggregate in aggregates.items()])
+            if self.retention is not None:
+                models.RequestStats.objects.filter(
+                    end__lt=end - datetime.timedelta(days=self.retention)) \
+                    .delete()
+        except DatabaseError:
+            # metrics must never break a request
+            logger.exception('Could not write request metrics.')
+
+    def recent(self):
+        with self.lock:
+            return list(self.records)
+
+
+request_metrics = RequestMetrics(
+    size=getattr(settings, 'REQUEST_METRICS_BUFFER', 2000),
+    interval=getattr(settings, 'REQUEST_METRICS_INTERVAL', 300),
+    keep_sql=getattr(settings, 'REQUEST_METRICS_SLOW_SQL', 3),
+    retention=getattr(settings, 'REQUEST_METRICS_RETENTION', 90))
+
+
+def view_name(request):
+    """ name under which a request is recorded, or None: url name of
+    student_manager views, admin changelists with the action name """
+    match = getattr(request, 'resolver_match', None)
+    if match is None or not match.url_name:
+        return None
+    name = match.view_name
+    if not name.startswith('admin:'):
+        return name
+    if not name.endswith('_changelist'):
+        return None
+    if request.method=='POST' and request.POST.get('action'):
+        name += ' [%s]' % request.POST['action']
+    return name
+
+
+class RequestMetricsMiddleware(object):
+    """ records latency and SQL statistics of the requests;
+    for streamed responses only the time until the response starts """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'REQUEST_METRICS', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder(request_metrics.keep_sql)
+        start = time.perf_counter()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+        latency = (time.perf_counter() - start) * 1000
+        view = view_name(request)
+        if view:
+            request_metrics.add(RequestRecord(
+                time=timezone.now(), view=view, method=request.method,
+                status=response.status_code, latency=latency,
+                queries=recorder.count, sql_time=recorder.time,
+                slowest=recorder.slowest))
+        return response
+
+
+def summarize_records(records):
+    """ per view statistics of RequestRecords, slowest (p95) first """
+    by_view = {}
+    for record in records:
+        by_view.setdefault(record.view, []).append(record)
+    rows = []
+    for view, view_records in by_view.items():
+        latencies = sorted(r.latency for r in view_records)
+        count = len(view_records)
+        slowest = []
+        for record in view_records:
+            keep_slowest(slowest, record.slowest, 3)
+        rows.append({
+            'view': view,
+            'count': count,
+            'errors': sum(1 for r in view_records if r.status>=500),
+            'p50': percentile(latencies, 50),
+            'p95': percentile(latencies, 95),
+            'p99': percentile(latencies, 99),
+            'max': latencies[-1],
+            'queries': sum(r.queries for r in view_records) / count,
+            'queries_max': max(r.queries for r in view_records),
+            'sql_time': sum(r.sql_time for r in view_records) / count,
+            'slowest': sorted(slowest, reverse=True)})
+    rows.sort(key=lambda row: row['p95'], reverse=True)
+    return rows
+
+
+def summarize_stats(stats):
+    """ per view statistics of RequestStats rows, merging their
+    latency histograms; slowest (p95) first """
+    merged = {}
+    for stat in stats:
+        row = merged.get(stat.view)
+        if row is None:
+            row = merged[stat.view] = {
+                'view': stat.view, 'count': 0, 'errors': 0,
+                'latency_sum': 0.0, 'max': 0.0,
+                'hist': [0] * (len(LATENCY_BUCKETS)+1),
+                'queries_sum': 0, 'queries_max': 0, 'sql_time_sum': 0.0,
+                'slowest': []}
+        row['count'] += stat.count
+        row['errors'] += stat.errors
+        row['latency_sum'] += stat.latency_sum
+        row['max'] = max(row['max'], stat.latency_max)
+        if stat.latency_hist:
+            for i, n in enumerate(json.loads(stat.latency_hist)):
+                row['hist'][i] += n
+        row['queries_sum'] += stat.queries_sum
+        row['queries_max'] = max(row['queries_max'], stat.queries_max)
+        row['sql_time_sum'] += stat.sql_time_sum
+        if stat.slowest_sql:
+            keep_slowest(row['slowest'],
+                         [tuple(e) for e in json.loads(stat.slowest_sql)],
+                         3)
+    rows = []
+    for row in merged.values():
+        count = row['count'] or 1
+        rows.append({
+            'view': row['view'],
+            'count': row['count'],
+            'errors': row['errors'],
+            'p50': hist_percentile(row['hist'], 50, row['max']),
+            'p95': hist_percentile(row['hist'], 95, row['max']),
+            'p99': hist_percentile(row['hist'], 99, row['max']),
+            'max': row['max'],
+            'queries': row['queries_sum'] / count,
+            'queries_max': row['queries_max'],
+            'sql_time': row['sql_time_sum'] / count,
+            'slowest': sorted(row['slowest'], reverse=True)})
+    rows.sort(key=lambda row: row['p95'] or 0, reverse=True)
+    return rows
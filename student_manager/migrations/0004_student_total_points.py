@@ -0,0 +1,34 @@
+# Generated by Django 4.2.16 on 2026-10-18 20:16
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def calc_total_points(apps, schema_editor):
+    Student = apps.get_model('student_manager', 'Student')
+    Exercise = apps.get_model('student_manager', 'Exercise')
+    exercise_sum = Exercise.objects.filter(student=OuterRef('pk')) \
+        .order_by().values('student').annotate(sum=Sum('points')) \
+        .values('sum')
+    Student.objects.update(
+        total_points=Coalesce(Subquery(exercise_sum),
+                              Value(Decimal('0.00')),
+                              output_field=models.DecimalField()))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('student_manager', '0003_auto_20211011_1654'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='student',
+            name='total_points',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), editable=False, max_digits=6),
+        ),
+        migrations.RunPython(calc_total_points, migrations.RunPython.noop),
+    ]
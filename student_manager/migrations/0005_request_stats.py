@@ -0,0 +1,35 @@
+# Generated by Django 4.2.16 on 2026-10-18 20:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('student_manager', '0004_student_total_points'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('view', models.CharField(db_index=True, max_length=200)),
+                ('start', models.DateTimeField()),
+                ('end', models.DateTimeField(db_index=True)),
+                ('count', models.IntegerField(default=0)),
+                ('errors', models.IntegerField(default=0)),
+                ('latency_sum', models.FloatField(default=0)),
+                ('latency_max', models.FloatField(default=0)),
+                ('latency_hist', models.TextField(blank=True)),
+                ('queries_sum', models.IntegerField(default=0)),
+                ('queries_max', models.IntegerField(default=0)),
+                ('sql_time_sum', models.FloatField(default=0)),
+                ('slowest_sql', models.TextField(blank=True)),
+            ],
+            options={
+                'verbose_name_plural': 'request stats',
+                'ordering': ('-end', 'view'),
+            },
+        ),
+    ]
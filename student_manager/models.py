@@ -1,13 +1,24 @@
 """The models for mapping database tables to Django objects."""
 
+from contextlib import contextmanager
 from decimal import Decimal
-from django.db import models
-from django.db.models import Sum, Max
+from django.conf import settings
+from django.db import connection, models, transaction
+from django.db.models import Case, Count, Sum, Max, F, OuterRef, Q, \
+    Subquery, Value, When
+from django.db.models.functions import Coalesce
 from django.core.exceptions import ValidationError
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 
+import array
+import bisect
+import functools
 import json
+import threading
+import time
+
+from student_manager import seatmap
 
 
 class StaticData(models.Model):
@@ -23,33 +34,192 @@ class StaticData(models.Model):
 
     @classmethod
     def get_key(cls, key, default=None):
-        try:
-            return cls.objects.get(key=key).value
-        except cls.DoesNotExist:
-            return default
+        return static_data_cache.get(key, default)
+
+    @classmethod
+    def has_key(cls, key):
+        return static_data_cache.has_key(key)
+
+    @classmethod
+    def get_int(cls, key, default=None):
+        return static_data_cache.get_parsed(key, int, default)
+
+    @classmethod
+    def get_decimal(cls, key, default=None):
+        return static_data_cache.get_parsed(key, Decimal, default)
+
+    @classmethod
+    def get_float(cls, key, default=None):
+        return static_data_cache.get_parsed(key, float, default)
 
     @classmethod
     def get_subject_transl(cls):
-        try:
-            jstr = cls.objects.get(key='subject_translation').value
-            jstr = jstr.translate({0xa0: 32})
-            transl = json.loads(jstr)
-            return transl
-        except cls.DoesNotExist:
-            return {}
+        # copy, since the parsed dictionary is shared by all callers
+        return dict(static_data_cache.get_parsed(
+            'subject_translation', parse_subject_transl, {}))
 
     @classmethod
     def get_sheet_points(cls):
-        return int(cls.get_key('sheet_points', 5))
+        return cls.get_int('sheet_points', 5)
 
     @classmethod
     def get_points_div(cls):
-        return int(cls.get_key('points_div', 2))
+        return cls.get_int('points_div', 2)
 
     @classmethod
     def get_lecture_name(cls):
         return cls.get_key('lecture')
 
+    @classmethod
+    def get_cohorts(cls, report=None):
+        """ cohorts (static data key cohorts) shown in the given
+        special query report """
+        cohorts = static_data_cache.get_parsed('cohorts', parse_cohorts,
+                                               DEFAULT_COHORTS)
+        return [c for c in cohorts if c.in_report(report)]
+
+
+def parse_subject_transl(jstr):
+    return json.loads(jstr.translate({0xa0: 32}))
+
+
+class Cohort(object):
+    """ named group of students for the special queries: a set of
+    subjects (None: all subjects) and a semester range [from, to]
+    (None: no limit) """
+
+    def __init__(self, name, subjects=None, semester=None, reports=None):
+        if subjects is not None and not isinstance(subjects, list):
+            raise ValueError('subjects of cohort %s must be a list' % name)
+        if semester is not None and (not isinstance(semester, list)
+                                     or len(semester)!=2):
+            raise ValueError('semester of cohort %s must be [from, to]'
+                             % name)
+        self.name = name
+        self.subjects = subjects
+        self.semester = semester
+        self.reports = reports
+
+    def in_report(self, report):
+        return report is None or self.reports is None \
+            or report in self.reports
+
+    def q(self, subject_field='student__subject', prefix='student__'):
+        """ filter for the students of this cohort, on the model with the
+        given subject field and path to Student """
+        q = Q()
+        if self.subjects is not None:
+            q &= Q(**{subject_field + '__in': self.subjects})
+        if self.semester is not None:
+            (sem_from, sem_to) = self.semester
+            if sem_from is not None:
+                q &= Q(**{prefix + 'semester__gte': sem_from})
+            if sem_to is not None:
+                q &= Q(**{prefix + 'semester__lte': sem_to})
+        return q
+
+
+def parse_cohorts(jstr):
+    """ json dictionary {name: {"subjects": [...], "semester": [from, to],
+    "reports": [...]}, ...}; all entries optional """
+    cohorts = json.loads(jstr.translate({0xa0: 32}))
+    if type(cohorts)!=dict:
+        raise ValueError('cohorts must be a dictionary')
+    result = []
+    for (name, spec) in cohorts.items():
+        if type(spec)!=dict:
+            raise ValueError('invalid cohort %s' % name)
+        try:
+            result.append(Cohort(name, **spec))
+        except TypeError:
+            raise ValueError('invalid cohort %s' % name)
+    return result
+
+
+FK6_SUBJECTS = ['ET', 'IT', 'WIng', 'Kombi ET']
+
+DEFAULT_COHORTS = \
+    [Cohort(subject, [subject], reports=['exam_first'])
+     for subject in FK6_SUBJECTS + ['Info', 'AS', 'Kombi Inf', 'Kombi Phy']] \
+    + [Cohort('FK6', FK6_SUBJECTS, reports=['exam_first']),
+       Cohort('all', reports=['exam_first']),
+       Cohort('all', reports=['exam_both']),
+       Cohort('FK6', FK6_SUBJECTS, reports=['exam_both']),
+       Cohort('1st year all', semester=[None, 2], reports=['exam_both']),
+       Cohort('1st year FK6', FK6_SUBJECTS, [None, 2],
+              reports=['exam_both'])]
+
+
+class StaticDataCache(object):
+    """ process-wide cache of all StaticData entries;
+    the table is read with one query on first access and dropped again
+    by the post_save/post_delete signals of StaticData (at once and
+    after the commit); other processes don't get these signals, so
+    the entries are reloaded after STATIC_DATA_CACHE_TTL seconds
+    (default 60, None: never);
+    parsed values (int, Decimal, json) are cached per (key, parser) """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.data = None            # (values, parsed)
+        self.loaded = 0
+        self.hits = 0
+        self.misses = 0
+
+    def expired(self):
+        ttl = getattr(settings, 'STATIC_DATA_CACHE_TTL', 60)
+        return ttl is not None and time.monotonic() - self.loaded >= ttl
+
+    def get_data(self):
+        data = self.data
+        if data is not None and not self.expired():
+            self.hits += 1
+            return data
+        with self.lock:
+            if self.data is None or self.expired():
+                self.misses += 1
+                values = dict(StaticData.objects.order_by('id')
+                              .values_list('key', 'value'))
+                self.data = (values, {})
+                self.loaded = time.monotonic()
+            return self.data
+
+    def get(self, key, default=None):
+        return self.get_data()[0].get(key, default)
+
+    def has_key(self, key):
+        return key in self.get_data()[0]
+
+    def get_parsed(self, key, parse, default=None):
+        """ return parse(value) for key, or default if key doesn't exist;
+        errors raised by parse are not cached """
+        values, parsed = self.get_data()
+        if key not in values:
+            return default
+        try:
+            return parsed[(key, parse)]
+        except KeyError:
+            result = parse(values[key])
+            parsed[(key, parse)] = result
+            return result
+
+    def clear(self):
+        self.data = None
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'loaded': self.data is not None}
+
+static_data_cache = StaticDataCache()
+
+@receiver(post_save, sender=StaticData)
+@receiver(post_delete, sender=StaticData)
+def clear_static_data_cache(sender, **kwargs):
+    static_data_cache.clear()
+    # a concurrent request may have reloaded the old values before the
+    # commit
+    transaction.on_commit(static_data_cache.clear)
+
 
 class Group(models.Model):
     number = models.IntegerField()
@@ -74,26 +244,36 @@ class Group(models.Model):
                 group = None
         return group
 
+    @classmethod
+    def get_groups(cls, numbers, create=False):
+        """ dict group number -> group with one query, missing groups
+        are created if create is set """
+        groups = {}
+        for group in cls.objects.filter(number__in=numbers).order_by('id'):
+            groups.setdefault(group.number, group)
+        missing = [number for number in numbers if number not in groups]
+        if create and missing:
+            cls.objects.bulk_create([cls(number=number)
+                                     for number in missing])
+            for group in cls.objects.filter(number__in=missing):
+                groups.setdefault(group.number, group)
+        return groups
+
     @classmethod
     def get_group_transl(cls, groups, create=False):
-        if cls.objects.count()>0:
-            max_group_number = \
-                cls.objects.aggregate(Max('number'))['number__max']
-        else:
-            max_group_number = 0
+        """ dict group string -> group with the same time, missing
+        groups are created if create is set """
         grp_transl = {}
-        for grpstr in groups:
-            try:
-                group = cls.objects.get(time=grpstr)
-            except cls.DoesNotExist:
-                if create:
-                    max_group_number +=  1
-                    group = cls.objects.create(number=max_group_number,
-                                               time=grpstr)
-                else:
-                    group = None
-            if group:
-                grp_transl[grpstr] = group
+        for group in cls.objects.filter(time__in=groups).order_by('number'):
+            grp_transl.setdefault(group.time, group)
+        missing = [grpstr for grpstr in groups if grpstr not in grp_transl]
+        if create and missing:
+            max_group_number = \
+                cls.objects.aggregate(Max('number'))['number__max'] or 0
+            for grpstr in missing:
+                max_group_number += 1
+                grp_transl[grpstr] = cls.objects.create(
+                    number=max_group_number, time=grpstr)
         return grp_transl
 
 
@@ -108,17 +288,31 @@ def validate_matrikel(matrikel, student_id):
         raise ValidationError('Matrikel already exists.')
 
 
-class StudentManager(models.Manager):
-    """ manager used in Student model """
-    def get_queryset(self):
-        """ make Student total_points field, by which we can order """
-        query = super(StudentManager, self).get_queryset()
-        return query.annotate(_total_points=Sum('exercise__points'))
-
-    def get_pure_queryset(self):
-        """ get query set without annotation/join;
-        needed for queries to count e.g. students by semester """
-        return super(StudentManager, self).get_queryset()
+class StudentQuerySet(models.QuerySet):
+    """ query set of the Student model """
+    def with_totals(self):
+        """ annotate number (exercise_count) and sum of points
+        (exercise_points) of the exercises; correlated subqueries, so
+        that update() and delete() still work on the query set """
+        exercises = Exercise.objects.filter(student=OuterRef('pk')) \
+            .order_by().values('student')
+        return self.annotate(
+            exercise_count=Coalesce(
+                Subquery(exercises.annotate(count=Count('id'))
+                         .values('count')),
+                Value(0)),
+            exercise_points=Coalesce(
+                Subquery(exercises.annotate(sum=Sum('points'))
+                         .values('sum')),
+                Value(Decimal('0.00')),
+                output_field=models.DecimalField()))
+
+    def with_bonus(self, params=None):
+        """ annotate the bonus status as of Student.bonus() (bonus_status)
+        from total_points and the entry test, in the same query """
+        if params is None:
+            params = BonusParams.get()
+        return self.annotate(bonus_status=params.expression())
 
 
 class Student(models.Model):
@@ -133,62 +327,93 @@ class Student(models.Model):
     semester = models.IntegerField(null=True, blank=True)
     group = models.ForeignKey(Group, models.CASCADE, null=True, blank=True)
     active = models.BooleanField(default=True)
+    # sum of exercise points; maintained by Exercise.save, the post_delete
+    # signal of Exercise and add_total_points for bulk changes
+    total_points = models.DecimalField(max_digits=6, decimal_places=2,
+                                       default=Decimal('0.00'),
+                                       editable=False)
 
-    objects = StudentManager()
+    objects = StudentQuerySet.as_manager()
 
     def __str__(self):
         return '%s, %s (%s)' % (self.last_name, self.first_name, self.matrikel)
 
     def number_of_exercises(self):
+        if hasattr(self, 'exercise_count'):
+            # annotated by with_totals()
+            return self.exercise_count
         return self.exercise_set.count()
 
     number_of_exercises.short_description = 'Exercises'
+    number_of_exercises.admin_order_field = 'exercise_count'
 
-    def total_points(self, force_recalc=False):
-        if hasattr(self, '_total_points') and not force_recalc:
-            _total_points = self._total_points
-        else:
-            _total_points = self.exercise_set.aggregate(
-                Sum('points'))['points__sum']
-        return _total_points or Decimal('0.0')
-    
-    total_points.admin_order_field = '_total_points'
+    @classmethod
+    def rebuild_total_points(cls):
+        """ recalculate the total_points column of all students from
+        their exercises """
+        exercise_sum = Exercise.objects.filter(student=OuterRef('pk')) \
+            .order_by().values('student').annotate(sum=Sum('points')) \
+            .values('sum')
+        return cls.objects.update(
+            total_points=Coalesce(
+                Subquery(exercise_sum),
+                Value(Decimal('0.00')),
+                output_field=models.DecimalField()))
 
     def bonus(self, force_recalc=False):
-        try:
-            bonus1 = Decimal(StaticData.objects.get(key='bonus1').value)
-            bonus2 = Decimal(StaticData.objects.get(key='bonus2').value)
-        except StaticData.DoesNotExist:
-            bonus1 = None
-        try:
-            StaticData.objects.get(key='require_etest')
-            etest = True
-        except StaticData.DoesNotExist:
-            etest = False
-
-        if not etest and not bonus1:
+        if hasattr(self, 'bonus_status') and not force_recalc:
+            # annotated by with_bonus()
+            return self.bonus_status
+        params = BonusParams.get()
+        if not params.etest and not params.bonus1:
             return None
-        if etest:
+        etest_result = None
+        if params.etest:
             try:
-                if self.entrytest.result=='fail':
-                    return 'etest fail'
+                etest_result = self.entrytest.result
             except EntryTest.DoesNotExist:
-                return 'no etest'
-        if bonus1:
-            total = self.total_points(force_recalc)
-            if total>=bonus2:
-                return '2/3'
-            elif total>=bonus1:
-                return '1/3'
+                pass
+        if params.bonus1 and force_recalc:
+            self.refresh_from_db(fields=['total_points'])
+        return params.bonus(self.total_points, etest_result)
 
-        return ''
+    bonus.admin_order_field = 'bonus_status'
 
-    def save(self, *args, **kwargs):
-        validate_matrikel(self.matrikel, self.id)
+    def set_modulo_matrikel(self):
+        """ derive modulo and obscured matrikel; done by save, needed
+        before bulk_create """
         if self.matrikel:
             self.modulo_matrikel = int(str(self.matrikel)[-4:])
         if self.matrikel and not self.obscured_matrikel:
             self.obscured_matrikel = '%04d' % self.modulo_matrikel
+
+    @classmethod
+    def create_bulk(cls, students):
+        """ insert new students (not yet in the database) with one query;
+        their ids are set afterwards """
+        for student in students:
+            student.set_modulo_matrikel()
+        cls.objects.bulk_create(students)
+        if students and students[0].id is None:
+            # backend without returned ids
+            ids = dict(cls.objects
+                       .filter(matrikel__in=[s.matrikel for s in students])
+                       .values_list('matrikel', 'id'))
+            for student in students:
+                student.id = ids.get(student.matrikel)
+
+    def save(self, *args, **kwargs):
+        validate_matrikel(self.matrikel, self.id)
+        self.set_modulo_matrikel()
+        if self.pk is not None and 'update_fields' not in kwargs and \
+                not kwargs.get('force_insert') and \
+                (not self._state.adding or
+                 Student.objects.filter(pk=self.pk).exists()):
+            # don't overwrite total_points (maintained by Exercise) of an
+            # existing row with a possibly outdated value of this instance
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name!='total_points']
         return super(Student, self).save(*args, **kwargs)
 
     class Meta:
@@ -224,22 +449,107 @@ class Exercise(models.Model):
     def __str__(self):
         return '%i: %1.1f - %s' % (self.sheet, self.points, self.student)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(Exercise, cls).from_db(db, field_names, values)
+        # remember loaded state for the total_points delta in save()
+        instance._loaded = (instance.__dict__.get('student_id'),
+                            instance.__dict__.get('points'))
+        return instance
+
     def save(self, *args, **kwargs):
         if float(self.points) not in valid_points():
             raise ValidationError('invalid point value')
-        return super(Exercise, self).save(*args, **kwargs)
+        points = Decimal(self.points)
+        with transaction.atomic():
+            loaded = getattr(self, '_loaded', None)
+            if loaded is None and self.pk is not None:
+                # not loaded from the database: subtract the stored points
+                loaded = Exercise.objects.filter(pk=self.pk) \
+                    .values_list('student_id', 'points').first()
+            deltas = {}
+            if loaded is not None and loaded[1] is not None:
+                deltas[loaded[0]] = -loaded[1]
+            deltas[self.student_id] = deltas.get(self.student_id, 0) + points
+            result = super(Exercise, self).save(*args, **kwargs)
+            add_total_points(deltas)
+        self._loaded = (self.student_id, points)
+        return result
 
     @classmethod
     def total_num_exercises(cls):
         return cls.objects.aggregate(total=Max('sheet'))['total'] or 0
 
+def add_total_points(deltas):
+    """ add point deltas {student_id: delta} to Student.total_points;
+    one update per distinct delta value """
+    students_by_delta = {}
+    for student_id, delta in deltas.items():
+        if delta:
+            students_by_delta.setdefault(delta, []).append(student_id)
+    for delta, student_ids in students_by_delta.items():
+        Student.objects.filter(id__in=student_ids) \
+                       .update(total_points=F('total_points') + delta)
+
+@receiver(post_delete, sender=Exercise)
+def update_total_points_from_exercise(sender, **kwargs):
+    exercise = kwargs['instance']
+    student_id, points = getattr(exercise, '_loaded',
+                                 (exercise.student_id, exercise.points))
+    add_total_points({student_id: -Decimal(points)})
+
+def update_student_marks(student_ids):
+    """ recalculate mark and final mark of all exams of the given students """
+    recalc_exam_marks(Exam.objects.filter(student__in=student_ids))
+
+
+class DirtyStudents(threading.local):
+    """ per thread set of students whose exam marks must be recalculated;
+    scheduled: flush_dirty_students is registered with the transaction """
+    def __init__(self):
+        self.ids = set()
+        self.scheduled = False
+
+dirty_students = DirtyStudents()
+
+def flush_pending():
+    return any(entry[1] is flush_dirty_students
+               for entry in connection.run_on_commit)
+
+def mark_students_dirty(student_ids):
+    """ schedule recalculation of the exam marks of the given students;
+    inside a transaction the students are collected and recalculated
+    once on commit, outside of a transaction immediately """
+    if dirty_students.scheduled and not flush_pending():
+        # the transaction (or savepoint) of the callback was rolled back
+        dirty_students.ids = set()
+        dirty_students.scheduled = False
+    dirty_students.ids.update(student_ids)
+    if not dirty_students.scheduled:
+        dirty_students.scheduled = True
+        transaction.on_commit(flush_dirty_students)
+
+def flush_dirty_students():
+    student_ids = dirty_students.ids
+    dirty_students.ids = set()
+    dirty_students.scheduled = False
+    if not student_ids:
+        return
+    with transaction.atomic():
+        update_student_marks(student_ids)
+
+@contextmanager
+def defer_mark_recalculation():
+    """ recalculate exam marks for all exercise changes of the enclosed
+    block once, when the (outermost) transaction is committed """
+    with transaction.atomic():
+        yield
+
 @receiver(post_save, sender=Exercise)
+@receiver(post_delete, sender=Exercise)
 def update_mark_from_exercise(sender, **kwargs):
     exercise = kwargs['instance']
-    for exam in exercise.student.exam_set.all():
-        exam.save(
-            force_recalc=True  # trigger recalculation of bonus in student model
-        )
+    mark_students_dirty([exercise.student_id])
 
 
 class MasterExam(models.Model):
@@ -253,11 +563,22 @@ class MasterExam(models.Model):
     def __str__(self):
         return '%s' % self.number
 
+    def get_mark_limits(self):
+        """ compiled mark limits (MarkLimits) or None """
+        return cached_parse(self, 'mark_limits', parse_mark_limits)
+
+    def get_part_points(self):
+        """ tuple of Decimal points per exam part or None """
+        return cached_parse(self, 'part_points', parse_part_points)
+
+    def save(self, *args, **kwargs):
+        clear_parse_cache(self)
+        return super(MasterExam, self).save(*args, **kwargs)
+
 @receiver(post_save, sender=MasterExam)
 def update_mark_from_masterexam(sender, **kwargs):
     masterexam = kwargs['instance']
-    for exam in masterexam.exam_set.all():
-        exam.save()
+    recalc_exam_marks(masterexam.exam_set.all())
 
 
 class Room(models.Model):
@@ -274,11 +595,214 @@ class Room(models.Model):
     def __str__(self):
         return '%s (%d)' % (self.name, self.examnr.number)
 
+    def get_seat_map(self):
+        """ seat numbers (indexable, see parse_seat_map) or None """
+        return cached_parse(self, 'seat_map', parse_seat_map)
+
+    def save(self, *args, **kwargs):
+        clear_parse_cache(self)
+        return super(Room, self).save(*args, **kwargs)
+
 
 BONUSMAP = {5.0: 5.0, 4.0: 3.7, 3.7: 3.3, 3.3: 3.0, 3.0: 2.7,
             2.7: 2.3, 2.3: 2.0, 2.0: 1.7, 1.7: 1.3, 1.3: 1.0,
             1.0: 1.0}
 
+def apply_bonus(mark, bonus):
+    if bonus == '1/3':
+        return BONUSMAP[mark]
+    elif bonus == '2/3':
+        return BONUSMAP[BONUSMAP[mark]]
+    else:
+        return mark
+
+def decimal_mark(mark):
+    """ mark as stored in the database (Decimal with one decimal place) """
+    if mark is None:
+        return None
+    return Decimal(str(mark)).quantize(Decimal('0.1'))
+
+
+class BonusParams(object):
+    """ static data needed for the bonus status of a student """
+
+    def __init__(self, bonus1, bonus2, etest):
+        if bonus2 is None:
+            bonus1 = None
+        self.bonus1 = bonus1
+        self.bonus2 = bonus2
+        self.etest = etest
+
+    @classmethod
+    def get(cls):
+        return cls(StaticData.get_decimal('bonus1'),
+                   StaticData.get_decimal('bonus2'),
+                   StaticData.has_key('require_etest'))
+
+    def bonus(self, total_points, etest_result):
+        """ bonus status for the given total exercise points and entry
+        test result (None: no entry test) """
+        if not self.etest and not self.bonus1:
+            return None
+        if self.etest:
+            if etest_result is None:
+                return 'no etest'
+            if etest_result=='fail':
+                return 'etest fail'
+        if self.bonus1:
+            if total_points>=self.bonus2:
+                return '2/3'
+            elif total_points>=self.bonus1:
+                return '1/3'
+        return ''
+
+    def expression(self, prefix=''):
+        """ the bonus status as in bonus() as SQL expression on Student,
+        or with prefix 'student__' on a model related to Student """
+        if not self.etest and not self.bonus1:
+            return Value(None, output_field=models.CharField())
+        whens = []
+        if self.etest:
+            whens.append(When(**{prefix + 'entrytest__result__isnull': True,
+                                 'then': Value('no etest')}))
+            whens.append(When(**{prefix + 'entrytest__result': 'fail',
+                                 'then': Value('etest fail')}))
+        if self.bonus1:
+            whens.append(When(**{prefix + 'total_points__gte': self.bonus2,
+                                 'then': Value('2/3')}))
+            whens.append(When(**{prefix + 'total_points__gte': self.bonus1,
+                                 'then': Value('1/3')}))
+        return Case(*whens, default=Value(''),
+                    output_field=models.CharField())
+
+
+class MarkLimits(object):
+    """ mark_limits of a MasterExam, sorted by points for bisection """
+
+    def __init__(self, mark_limits):
+        limits = sorted((Decimal(str(points)), mark)
+                        for points, mark in mark_limits)
+        self.points = [points for points, mark in limits]
+        self.marks = [mark for points, mark in limits]
+
+    def mark(self, points):
+        """ mark of the highest limit <= points (None below all limits) """
+        i = bisect.bisect_right(self.points, points)
+        if i==0:
+            return None
+        return self.marks[i-1]
+
+    def descending(self):
+        """ list of (points, mark), ordered by decreasing points """
+        return list(zip(reversed(self.points), reversed(self.marks)))
+
+
+# Parsers for the json text fields of MasterExam and Room.  They raise
+# ValueError for invalid values and are cached by value, so that all
+# instances with the same value share the parsed object, which must
+# therefore not be modified.
+
+@functools.lru_cache(maxsize=64)
+def parse_mark_limits(mark_limits_str):
+    if not mark_limits_str:
+        return None
+    mark_limits = json.loads(mark_limits_str)
+    if type(mark_limits) != list:
+        raise ValueError('Expect list of point-mark-tuples')
+    for entry in mark_limits:
+        if type(entry) != list or len(entry) != 2:
+            raise ValueError('Expect list of point-mark-tuples')
+        for value in entry:
+            if type(value) not in (int, float):
+                raise ValueError('Expect list of point-mark-tuples')
+    return MarkLimits(mark_limits)
+
+@functools.lru_cache(maxsize=64)
+def parse_part_points(part_points_str):
+    if not part_points_str:
+        return None
+    part_points = json.loads(part_points_str)
+    if type(part_points) != list or \
+            any(type(p) not in (int, float) for p in part_points):
+        raise ValueError('Expect list of points')
+    return tuple(Decimal(str(p)) for p in part_points)
+
+@functools.lru_cache(maxsize=64)
+def parse_seat_map(seat_map_str):
+    """ seat map spec (seatmap.SeatMap, seats generated on first access)
+    or json list of seat numbers (array) """
+    if not seat_map_str:
+        return None
+    if not seat_map_str.lstrip().startswith('['):
+        return seatmap.SeatMap(seat_map_str)
+    seat_map = json.loads(seat_map_str)
+    if type(seat_map) != list or \
+            any(type(seat) != int for seat in seat_map):
+        raise ValueError('Expect list of seat numbers')
+    return array.array('i', seat_map)
+
+def cached_parse(instance, field, parse):
+    """ parse(value of field), cached on the instance by value hash """
+    value = getattr(instance, field)
+    cache = instance.__dict__.setdefault('_parse_cache', {})
+    key = (field, hash(value))
+    try:
+        return cache[key]
+    except KeyError:
+        parsed = parse(value)
+        cache[key] = parsed
+        return parsed
+
+def clear_parse_cache(instance):
+    instance.__dict__.pop('_parse_cache', None)
+
+
+def recalc_exam_marks(exams):
+    """ recalculate mark and final mark of the exams in the Exam queryset;
+    reads the exams with the bonus data of their students in one query
+    and writes the changed exams with one UPDATE per distinct
+    (mark, final_mark) pair;
+    returns the number of changed exams """
+    params = BonusParams.get()
+    limits = {}
+    for examnr, mark_limits in MasterExam.objects \
+            .filter(id__in=exams.values('examnr')) \
+            .values_list('id', 'mark_limits'):
+        limits[examnr] = parse_mark_limits(mark_limits)
+    rows = exams.order_by().values_list(
+        'id', 'examnr', 'points', 'mark', 'final_mark',
+        'student__total_points', 'student__entrytest__result')
+    changed = {}                        # (mark, final_mark) -> [exam id]
+    for (exam_id, examnr, points, old_mark, old_final_mark,
+         total_points, etest_result) in rows.iterator(chunk_size=2000):
+        mark_limits = limits.get(examnr)
+        mark = final_mark = None
+        if mark_limits and points is not None:
+            mark = mark_limits.mark(points)
+            if mark is not None:
+                bonus = params.bonus(total_points, etest_result)
+                final_mark = apply_bonus(mark, bonus)
+        mark = decimal_mark(mark)
+        final_mark = decimal_mark(final_mark)
+        if mark!=old_mark or final_mark!=old_final_mark:
+            changed.setdefault((mark, final_mark), []).append(exam_id)
+    count = 0
+    for (mark, final_mark), exam_ids in changed.items():
+        for i in range(0, len(exam_ids), 500):
+            Exam.objects.filter(id__in=exam_ids[i:i+500]) \
+                        .update(mark=mark, final_mark=final_mark)
+        count += len(exam_ids)
+    return count
+
+
+class ExamQuerySet(models.QuerySet):
+    """ query set of the Exam model """
+    def with_bonus(self):
+        """ annotate the bonus status of the student (bonus_status) """
+        return self.annotate(
+            bonus_status=BonusParams.get().expression('student__'))
+
+
 class Exam(models.Model):
     student = models.ForeignKey(Student, models.CASCADE)
     subject = models.CharField(max_length=200, blank=True)
@@ -294,6 +818,8 @@ class Exam(models.Model):
     final_mark = models.DecimalField(max_digits=2, decimal_places=1,
                                      null=True, blank=True)
 
+    objects = ExamQuerySet.as_manager()
+
     class Meta:
         unique_together = (('student', 'examnr'),
                            ('examnr','number'))
@@ -303,25 +829,26 @@ class Exam(models.Model):
         return '%i: %s' % (self.examnr.number, self.student)
 
     def save(self, *args, **kwargs):
-        force_recalc = kwargs.pop('force_recalc', False)
-
-        if self.examnr.mark_limits and self.points != None:
-            mark_limits = json.loads(self.examnr.mark_limits)
-            for limit,mark in mark_limits:
-                if self.points >= limit:
-                    self.mark = mark
-                    break
-
-            bonus = self.student.bonus(force_recalc)
-            if bonus == '1/3':
-                self.final_mark = BONUSMAP[self.mark]
-            elif bonus == '2/3':
-                self.final_mark = BONUSMAP[BONUSMAP[self.mark]]
-            else:
-                self.final_mark = self.mark
+        # the bonus is always read from the database
+        kwargs.pop('force_recalc', None)
+
+        self.mark = None
+        self.final_mark = None
+        if self.points is None:
+            mark_limits = None
         else:
-            self.mark = None
-            self.final_mark = None
+            mark_limits = self.examnr.get_mark_limits()
+        if mark_limits:
+            self.mark = mark_limits.mark(self.points)
+            if self.mark is not None:
+                params = BonusParams.get()
+                bonus = None
+                if params.etest or params.bonus1:
+                    # total points and entry test with one query
+                    bonus = Student.objects.filter(id=self.student_id) \
+                        .with_bonus(params) \
+                        .values_list('bonus_status', flat=True).get()
+                self.final_mark = apply_bonus(self.mark, bonus)
 
         return super(Exam, self).save(*args, **kwargs)
 
@@ -373,3 +900,87 @@ class EntryTest(models.Model):
         
     def __str__(self):
         return '%s: %s' % (self.student, self.result)
+
+
+class RequestStats(models.Model):
+    """ request metrics of one view, aggregated over one period by
+    metrics.RequestMetricsMiddleware """
+    view = models.CharField(max_length=200, db_index=True)
+    start = models.DateTimeField()
+    end = models.DateTimeField(db_index=True)
+    count = models.IntegerField(default=0)
+    errors = models.IntegerField(default=0)
+    # times in ms
+    latency_sum = models.FloatField(default=0)
+    latency_max = models.FloatField(default=0)
+    # json list: number of requests per metrics.LATENCY_BUCKETS bucket
+    latency_hist = models.TextField(blank=True)
+    queries_sum = models.IntegerField(default=0)
+    queries_max = models.IntegerField(default=0)
+    sql_time_sum = models.FloatField(default=0)
+    # json list of [ms, sql] of the slowest statements
+    slowest_sql = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ('-end', 'view')
+        verbose_name_plural = 'request stats'
+
+    def __str__(self):
+        return '%s: %s' % (self.view, self.end)
+
+
+class ImportJob(models.Model):
+    """ an uploaded file imported in the background, see jobs.py """
+    STATES = [('queued', 'queued'), ('running', 'running'),
+              ('done', 'done'), ('failed', 'failed')]
+    kind = models.CharField(max_length=50)
+    state = models.CharField(max_length=10, choices=STATES,
+                             default='queued', db_index=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, models.SET_NULL,
+                             null=True, blank=True)
+    file_name = models.CharField(max_length=200, blank=True)
+    # the uploaded file; emptied when the job is done
+    data = models.BinaryField(blank=True)
+    # json dictionary of the form options
+    options = models.TextField(blank=True)
+    return_url = models.CharField(max_length=200, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+    rows_done = models.IntegerField(default=0)
+    rows_total = models.IntegerField(null=True, blank=True)
+    # json dictionary: number of entries per import statistics key
+    stats = models.TextField(blank=True)
+    # json list of [level, text] of the django messages of the import
+    messages = models.TextField(blank=True)
+    messages_shown = models.BooleanField(default=False)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ('-created',)
+
+    def __str__(self):
+        return '%s %s: %s' % (self.kind, self.file_name, self.state)
+
+    def get_options(self):
+        return json.loads(self.options or '{}')
+
+    def get_messages(self):
+        return json.loads(self.messages or '[]')
+
+    def is_finished(self):
+        return self.state in ('done', 'failed')
+
+    def status(self):
+        """ progress for the job page """
+        messages = self.get_messages()
+        return {'id': self.id,
+                'kind': self.kind,
+                'state': self.state,
+                'rows_done': self.rows_done,
+                'rows_total': self.rows_total,
+                'stats': json.loads(self.stats or '{}'),
+                # warnings and errors (messages.WARNING = 30)
+                'errors': len([m for m in messages if m[0]>=30]),
+                'messages': [m[1] for m in messages],
+                'error': self.error.strip().split('\n')[-1]}
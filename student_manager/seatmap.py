@@ -0,0 +1,118 @@
+"""Seat maps of exam rooms.
+
+A seat map is given by the compact spec 'step block...' of
+helpers/seatmap.py instead of the full list of seat numbers:
+
+step: seat increment
+
+block: i:n[:k[:s[:d]]]
+   first seat i, last possible seat n, row length k,
+   row shift s, row length increment d
+"""
+
+import array
+
+
+# upper limit of seat numbers and of the number of seats of a spec,
+# protects against runaway specs
+MAX_SEAT = 100000
+
+
+class ArgumentError(ValueError):
+    pass
+
+
+class SeatMapper:
+    def __init__(self, args):
+        if len(args)==0:
+            raise ArgumentError('Expect step and seat blocks')
+        try:
+            self.step = int(args[0])
+            self.blockparams = []
+            for block in args[1:]:
+                self.blockparams.append(self.decode_blockparams(block))
+        except ValueError:
+            raise ArgumentError('Invalid seat map spec')
+        if self.step<=0:
+            raise ArgumentError('Invalid seat map spec')
+
+    @classmethod
+    def from_spec(cls, spec):
+        """ mapper of the spec string 'step block...' """
+        return cls(spec.split())
+
+    def decode_blockparams(self, block):
+        fields = block.split(':')
+        if len(fields)<2 or len(fields)>5:
+            raise ArgumentError
+        i = int(fields[0]) - 1
+        n = int(fields[1])
+        if len(fields)>=3:
+            rowlength = int(fields[2])
+        elif len(fields)==2:
+            rowlength = n - i
+            rowshift = i
+        if len(fields)>=4:
+            rowshift = int(fields[3])
+        elif len(fields)==3:
+            rowshift = 0
+        if len(fields)>=5:
+            rowincr = int(fields[4])
+        else:
+            rowincr = 0
+        if i<0 or n<=i or n>MAX_SEAT or rowlength<=0:
+            raise ArgumentError
+        return (i,n,rowlength,rowshift,rowincr)
+
+    def generate(self):
+        """ list of seat numbers """
+        seats = []
+        for block in self.blockparams:
+            seats.extend(self.gen_block(block))
+            if len(seats)>MAX_SEAT:
+                raise ArgumentError('Too many seats')
+        return seats
+
+    def gen_block(self, blockdata):
+        firstseat,n,rowlength,rowshift,rowincr = blockdata
+        startrow = (firstseat-rowshift) // rowlength
+        rowoffset = startrow*rowlength + rowshift
+        seatoffset = firstseat-rowoffset
+        seats = []
+        while rowoffset<n and rowlength>0:
+            newseats = list(range(1+rowoffset+seatoffset,
+                                  min(n,rowoffset+rowlength) + 1,
+                                  self.step))
+            seats.extend(newseats)
+            rowoffset += 2*rowlength + rowincr
+            rowlength += 2*rowincr
+        return seats
+
+
+def generate_seats(spec):
+    """ list of seat numbers of the spec string """
+    return SeatMapper.from_spec(spec).generate()
+
+
+class SeatMap:
+    """ seat numbers of a spec; the spec is checked at once, the seats
+    are generated on first access and kept as array('i') """
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.mapper = SeatMapper.from_spec(spec)
+        self._seats = None
+
+    def seats(self):
+        if self._seats is None:
+            self._seats = array.array('i', self.mapper.generate())
+        return self._seats
+
+    def __len__(self):
+        return len(self.seats())
+
+    def __getitem__(self, index):
+        return self.seats()[index]
+
+    def __iter__(self):
+        return iter(self.seats())
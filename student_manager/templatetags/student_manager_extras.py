@@ -7,10 +7,6 @@ register = template.Library()
 
 
 def static_data(key):
-    try:
-        data = models.StaticData.objects.get(key=key)
-        return str(data.value)
-    except models.StaticData.DoesNotExist:
-        return ''
+    return str(models.StaticData.get_key(key, ''))
 
 register.simple_tag(static_data)
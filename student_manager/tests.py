@@ -0,0 +1,228 @@
+"""Query count tests of the Student queries and the student admin,
+consistency of the stored exercise point totals and the bonus status,
+room seat maps."""
+
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.db.models import Sum
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from student_manager import forms, models, seatmap
+
+
+CHANGELIST = '/admin/student_manager/student/'
+
+
+class StudentQueryTest(TestCase):
+    def setUp(self):
+        user = User.objects.create(username='staff', is_staff=True,
+                                   is_superuser=True)
+        self.client.force_login(user)
+        self.group = models.Group.objects.create(number=1, time='Mo 10')
+        models.StaticData.objects.create(key='bonus1', value='3')
+        models.StaticData.objects.create(key='bonus2', value='4')
+        self.add_students(0, 20)
+
+    def add_students(self, start, end):
+        for i in range(start, end):
+            student = models.Student.objects.create(
+                matrikel=100000+i, last_name='L%02d' % i, group=self.group,
+                subject='Elektrotechnik', active=i%2==0)
+            for sheet in range(1, i%4 + 1):
+                models.Exercise.objects.create(student=student,
+                                               group=self.group,
+                                               sheet=sheet,
+                                               points=Decimal('1.5'))
+
+    def changelist_queries(self, query=''):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(CHANGELIST + query)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def run_action(self, action, query=''):
+        """ run the action on all students of the (sorted) changelist """
+        response = self.client.post(CHANGELIST + query, {
+            'action': action, 'index': '0', 'select_across': '1',
+            '_selected_action': list(models.Student.objects
+                                     .values_list('id', flat=True))})
+        self.assertEqual(response.status_code, 302)
+
+    def test_plain_lookups(self):
+        """ Student.objects doesn't join or group by """
+        with self.assertNumQueries(1):
+            models.Student.objects.get(matrikel=100003)
+        with CaptureQueriesContext(connection) as queries:
+            list(models.Student.objects.filter(group=self.group))
+            models.Student.objects.filter(matrikel=100003).exists()
+            models.validate_matrikel(999999, None)
+        for query in queries:
+            self.assertNotIn('JOIN', query['sql'])
+            self.assertNotIn('GROUP BY', query['sql'])
+
+    def test_with_totals(self):
+        for student in models.Student.objects.with_totals():
+            i = student.matrikel - 100000
+            self.assertEqual(student.exercise_count, i%4)
+            self.assertEqual(student.exercise_points, Decimal('1.5') * (i%4))
+
+    def test_changelist_queries(self):
+        """ the number of queries doesn't grow with the rows shown """
+        sortings = ('', '?o=10', '?o=12', '?o=-12')
+        counts = [self.changelist_queries(query) for query in sortings]
+        self.add_students(20, 40)
+        self.assertEqual([self.changelist_queries(query)
+                          for query in sortings], counts)
+
+    def test_actions_sorted(self):
+        """ the student actions work on a changelist sorted by bonus """
+        for query in ('?o=12', '?o=-12'):
+            before = dict(models.Student.objects.values_list('id', 'active'))
+            self.run_action('toggle_active', query)
+            after = dict(models.Student.objects.values_list('id', 'active'))
+            self.assertEqual(after, dict((k, not v)
+                                         for (k, v) in before.items()))
+
+        models.StaticData.objects.create(key='subject_translation',
+                                         value='{"Elektrotechnik": "ET"}')
+        self.run_action('translate_subjects', '?o=12')
+        self.assertEqual(set(models.Student.objects
+                             .values_list('subject', flat=True)), {'ET'})
+
+        models.Student.objects.update(active=True)
+        self.run_action('make_no_exercs_inactive', '?o=-12')
+        self.assertEqual(
+            set(models.Student.objects.filter(active=False)
+                .values_list('matrikel', flat=True)),
+            set(100000+i for i in range(20) if i%4==0))
+
+
+class TotalPointsTest(TestCase):
+    def setUp(self):
+        user = User.objects.create(username='staff', is_staff=True,
+                                   is_superuser=True)
+        self.client.force_login(user)
+        self.group = models.Group.objects.create(number=1, time='Mo 10')
+        self.student1 = models.Student.objects.create(matrikel=100001,
+                                                      group=self.group)
+        self.student2 = models.Student.objects.create(matrikel=100002,
+                                                      group=self.group)
+
+    def assertTotals(self):
+        """ stored total_points are the sums of the exercise points """
+        for student in models.Student.objects \
+                .annotate(points_sum=Sum('exercise__points')):
+            self.assertEqual(student.total_points,
+                             student.points_sum or 0, student.matrikel)
+
+    def test_save(self):
+        exercise = models.Exercise.objects.create(
+            student=self.student1, sheet=1, points=Decimal('3.5'))
+        models.Exercise.objects.create(student=self.student1, sheet=2,
+                                       points=2)
+        self.assertTotals()
+        exercise.points = 1
+        exercise.save()
+        self.assertTotals()
+        # move to another student
+        exercise.student = self.student2
+        exercise.save()
+        self.assertTotals()
+        # instances not loaded from the database
+        models.Exercise(id=exercise.id, student=self.student1, sheet=1,
+                        points=4).save()
+        self.assertTotals()
+        models.Student(id=self.student1.id, matrikel=100001,
+                       group=self.group, last_name='L').save()
+        self.assertTotals()
+        self.student1.refresh_from_db()
+        self.assertEqual(self.student1.last_name, 'L')
+        models.Student(id=99, matrikel=100099).save()
+        self.assertTotals()
+
+    def test_admin_delete(self):
+        for sheet in (1, 2, 3):
+            models.Exercise.objects.create(student=self.student1,
+                                           sheet=sheet, points=sheet)
+        exercise = models.Exercise.objects.get(sheet=2)
+        response = self.client.post(
+            '/admin/student_manager/exercise/%d/delete/' % exercise.id,
+            {'post': 'yes'})
+        self.assertEqual(response.status_code, 302)
+        self.assertTotals()
+        response = self.client.post(
+            '/admin/student_manager/exercise/',
+            {'action': 'delete_selected', 'post': 'yes',
+             '_selected_action': list(models.Exercise.objects
+                                      .values_list('id', flat=True))})
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(models.Exercise.objects.exists())
+        self.assertTotals()
+
+    @override_settings(IMPORT_JOBS=False)
+    def test_import(self):
+        models.Exercise.objects.create(student=self.student1, sheet=1,
+                                       points=2)
+        csv_file = SimpleUploadedFile(
+            'ex.csv', b'100001;1.5;2;-\n100002;3;;4,5\n')
+        response = self.client.post('/import_exercises/', {
+            'format': 'sheet', 'group': self.group.id,
+            'column_separator': ';', 'csv_file': csv_file})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(models.Exercise.objects.count(), 4)
+        self.assertTotals()
+
+
+class RoomFormTest(TestCase):
+    def seat_map_errors(self, seat_map):
+        form = forms.RoomForm({'examnr': 1, 'name': 'H1', 'capacity': 10,
+                               'priority': 1, 'first_seat': 1,
+                               'seat_map': seat_map})
+        form.is_valid()
+        return form.errors.get('seat_map')
+
+    def test_seat_map(self):
+        self.assertIsNone(self.seat_map_errors('2 1:120:20'))
+        self.assertIsNone(self.seat_map_errors('[1, 3, 5]'))
+        self.assertIsNone(self.seat_map_errors(''))
+        for spec in ('1 -10000000:10:1',        # first seat < 1
+                     '1 0:10',
+                     '1 20:10',                 # last seat < first seat
+                     '1 1:%d' % (seatmap.MAX_SEAT+1),
+                     '1' + ' 1:%d' % seatmap.MAX_SEAT * 2,  # too many
+                     '0 1:10', '1 1:10:0', '1 x:10', '[1, "a"]'):
+            self.assertIsNotNone(self.seat_map_errors(spec), spec)
+
+
+class BonusTest(TestCase):
+    def test_sql_matches_python(self):
+        """ with_bonus() gives the same status as BonusParams.bonus() """
+        students = []
+        matrikel = 100000
+        for result in (None, 'fail', '', 'pass'):
+            for points in ('0', '2.5', '3', '3.5', '4', '10'):
+                matrikel += 1
+                student = models.Student.objects.create(matrikel=matrikel)
+                models.Student.objects.filter(id=student.id) \
+                    .update(total_points=Decimal(points))
+                if result is not None:
+                    models.EntryTest.objects.create(student=student,
+                                                    result=result)
+                students.append((student.id, Decimal(points), result))
+        for bonus1, bonus2, etest in ((3, 4, True), (3, 4, False),
+                                      (3, None, True), (3, None, False),
+                                      (None, None, False)):
+            params = models.BonusParams(
+                Decimal(bonus1) if bonus1 is not None else None,
+                Decimal(bonus2) if bonus2 is not None else None,
+                etest)
+            sql_status = dict(models.Student.objects.with_bonus(params)
+                              .values_list('id', 'bonus_status'))
+            for student_id, points, result in students:
+                self.assertEqual(sql_status[student_id],
+                                 params.bonus(points, result),
+                                 (bonus1, bonus2, etest, points, result))
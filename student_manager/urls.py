@@ -38,6 +38,11 @@ urlpatterns = [
         name='import_exams'),
     re_path(r'^import_entrytests/$', views.import_entrytests,
         name='import_entrytests'),
+    re_path(r'^import_job/(?P<job_id>\d+)/$', views.import_job,
+        name='import_job'),
+    re_path(r'^import_job/(?P<job_id>\d+)/status/$',
+        views.import_job_status,
+        name='import_job_status'),
     re_path(r'^save_exam_results/$', views.save_exam_results,
         name='save_exam_results'),
     re_path(r'^save_exercise_results/$', views.save_exercise_results,
@@ -70,5 +75,7 @@ urlpatterns = [
         name='export_entrytests'),
     re_path(r'^export_examresults/$', views.export_examresults,
         name='export_examresults'),
+    re_path(r'^request_metrics/$', views.request_metrics,
+        name='request_metrics'),
     re_path(r'^admin/', admin.site.urls),
 ]
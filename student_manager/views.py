@@ -1,48 +1,114 @@
 """Views"""
 
-import csv, re, json, urllib.request, urllib.parse, urllib.error
+import csv, datetime, itertools, re, urllib.request, urllib.parse, \
+    urllib.error
 import xml.etree.ElementTree as ElementTree
-from decimal import Decimal
+from decimal import Decimal, InvalidOperation
 from io import TextIOWrapper
 
 from django.contrib import messages
 from django.contrib.admin.views.decorators import staff_member_required
 from django.core.exceptions import ValidationError
-from django.db import IntegrityError
+from django.db import transaction
 from django.urls import reverse, reverse_lazy
-from django.db.models import Max, Count, F, Sum
-from django.http import HttpResponseRedirect, HttpResponse
-from django.shortcuts import render
+from django.db.models import Max, Count, Exists, F, OuterRef, Q, Subquery, \
+    Sum, Value
+from django.db.models.functions import Floor
+from django.http import HttpResponseRedirect, JsonResponse, \
+    StreamingHttpResponse
+from django.shortcuts import get_object_or_404, render
 from django.template import RequestContext
+from django.utils import timezone
 from django.views.decorators.http import require_POST
 from django.views.generic.edit import FormView
 from django.views.generic.list import ListView
 from django.views.generic import TemplateView
 
-from student_manager import forms, models
+from student_manager import forms, jobs, metrics, models
 
 
-class ImportExercisesView(FormView):
+class Echo(object):
+    """ pseudo file for csv.writer: write returns the written line """
+    def write(self, value):
+        return value
+
+def chunked(iterable, size):
+    """ lists of at most size items of the iterable """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def csv_response(filename, header, rows):
+    """ streaming csv download; rows is iterated lazily while sending """
+    writer = csv.writer(Echo(), delimiter=';')
+    def lines():
+        yield writer.writerow(header)
+        for row in rows:
+            yield writer.writerow(row)
+    response = StreamingHttpResponse(lines(), content_type='text/csv')
+    response['Content-Disposition'] = \
+        'attachment; filename="%s"' % filename
+    return response
+
+
+class ImportJobMixin(object):
+    """ import FormView run as background job (see jobs.py): form_valid
+    stores the upload and the options returned by get_import_options and
+    redirects to the job page; the job calls import_file(file, options)
+    with a jobs.JobRequest as request """
+    job_kind = None
+    file_field = 'csv_file'
+
+    def form_valid(self, form):
+        uploaded_file = form.cleaned_data[self.file_field]
+        options = self.get_import_options(form.cleaned_data)
+        if not jobs.jobs_enabled():
+            self.import_file(uploaded_file.file, options)
+            return super(ImportJobMixin, self).form_valid(form)
+        job = jobs.submit(self.job_kind, uploaded_file, options,
+                          return_url=self.get_success_url(),
+                          user=self.request.user)
+        return HttpResponseRedirect(reverse('import_job', args=(job.id,)))
+
+    def progress(self, done, total=None):
+        """ report the number of processed rows to the job, if any """
+        report = getattr(self.request, 'report_progress', None)
+        if report is not None:
+            report(done, total, self.stats)
+
+
+class ImportExercisesView(ImportJobMixin, FormView):
     template_name = 'student_manager/import_ex.html'
     form_class = forms.ImportExercisesForm
+    job_kind = 'exercises'
 
     def get_success_url(self):
         return self.request.GET.get('return_url', '/')
 
-    def form_valid(self, form):
-        importformat = form.cleaned_data['format']
-        group = form.cleaned_data['group']
-        uploaded_file = form.cleaned_data['csv_file']
-        csv_file = TextIOWrapper(uploaded_file.file, encoding='utf-8')
+    def get_import_options(self, data):
+        return {'format': data['format'],
+                'group': data['group'].id if data['group'] else None,
+                'column_separator': str(data['column_separator'])}
+
+    def import_file(self, binary_file, options):
+        importformat = options['format']
+        group = None
+        if options['group'] is not None:
+            group = models.Group.objects.get(id=options['group'])
+        csv_file = TextIOWrapper(binary_file, encoding='utf-8')
         csvreader = csv.reader(
             csv_file,
-            delimiter=str(form.cleaned_data['column_separator']))
+            delimiter=options['column_separator'])
         self.stats = {'new': [],
                       'updated': [],
                       'unchanged': [],
                       'unknown_student': [],
                       'invalid_points': [],
                       'no_matrikel': []}
+        rows = []
         for line, row in enumerate(csvreader):
             if not row:
                 # ignore empty line
@@ -54,22 +120,28 @@ class ImportExercisesView(FormView):
                 else:
                     self.stats['no_matrikel'].append(row)
                 continue
+            rows.append(row)
+
+        self.load_data(rows, importformat)
+        for (done, row) in enumerate(rows):
+            self.progress(done, len(rows))
             try:
-                student = models.Student.objects.get(matrikel=row[0])
-            except models.Student.DoesNotExist:
+                student = self.students[int(row[0])]
+            except KeyError:
                 self.stats['unknown_student'].append(row[0])
                 continue
             if importformat == 'exerc':
                 self.save_exercise(group, student, row[1], row[2])
             else:
-                if form.cleaned_data['format'] == 'sheet':
+                if importformat == 'sheet':
                     pointenum = enumerate(row[1:])
                 else:
-                    group = models.Group.objects.get(number=row[1])
+                    group = self.groups[int(row[1])]
                     pointenum = enumerate(row[2:])
                 for i, points in pointenum:
                     sheet = i+1
                     self.save_exercise(group, student, sheet, points)
+        self.write_data()
 
         messages.info(
             self.request,
@@ -100,8 +172,30 @@ class ImportExercisesView(FormView):
                 self.request,
                 '%s entries without matrikel skipped.' \
                     % len(self.stats['no_matrikel']))
-
-        return super(ImportExercisesView, self).form_valid(form)
+        self.progress(len(rows), len(rows))
+
+    def load_data(self, rows, importformat):
+        """ read all students, exercises and groups needed for the
+        import with a few queries """
+        matrikels = set(int(row[0]) for row in rows)
+        self.students = {}
+        for student in models.Student.objects \
+                .filter(matrikel__in=matrikels):
+            self.students[student.matrikel] = student
+        self.exercises = {}
+        for exercise in models.Exercise.objects \
+                .filter(student__in=list(self.students.values())):
+            self.exercises[(exercise.student_id, exercise.sheet)] = exercise
+        if importformat == 'sheet-wgrp':
+            self.groups = {}
+            for group in models.Group.objects.all():
+                self.groups[group.number] = group
+        self.valid_points = set(models.valid_points())
+        self.new_exercises = []
+        self.changed_exercises = {}
+        self.changed_students = {}
+        self.marks_changed = set()
+        self.point_deltas = {}
 
     def save_exercise(self, group, student, sheet, points):
         status_msg = str(student.matrikel)
@@ -109,29 +203,61 @@ class ImportExercisesView(FormView):
             return
         points = points.replace(',', '.')
         try:
-            exercise = models.Exercise.objects.get(student=student, sheet=sheet)
-            if exercise.points==Decimal(points):
-                status = 'unchanged'
-            else:
-                status = 'updated'
-                status_msg += ", %d: %s->%s" % (sheet, exercise.points, points)
-        except models.Exercise.DoesNotExist:
+            sheet = int(sheet)
+            raw_points = Decimal(points)
+            if not raw_points.is_finite():
+                raise InvalidOperation(points)
+        except (ValueError, InvalidOperation):
+            self.stats['invalid_points'].append(status_msg)
+            return
+        key = (student.id, sheet)
+        exercise = self.exercises.get(key)
+        if exercise is None:
             exercise = models.Exercise(student=student, sheet=sheet)
             status = 'new'
-        exercise.points = points
-        exercise.group = group
-        try:
-            exercise.save()
-        except ValidationError:
+        elif exercise.points==raw_points:
+            status = 'unchanged'
+        else:
+            status = 'updated'
+            status_msg += ", %d: %s->%s" % (sheet, exercise.points, points)
+        # check the value as given, before rounding: 2.504 is invalid
+        if raw_points not in self.valid_points:
             self.stats['invalid_points'].append(status_msg)
             return
-        
-        if student.group==None:
+        new_points = raw_points.quantize(Decimal('0.01'))
+
+        if status=='new':
+            self.exercises[key] = exercise
+            self.new_exercises.append(exercise)
+        elif exercise.id and (status=='updated' or
+                              exercise.group_id!=getattr(group, 'id', None)):
+            self.changed_exercises[key] = exercise
+        if status!='unchanged':
+            self.marks_changed.add(student.id)
+            delta = new_points - (exercise.points or 0)
+            self.point_deltas[student.id] = \
+                self.point_deltas.get(student.id, 0) + delta
+        exercise.points = new_points
+        exercise.group = group
+
+        if student.group_id==None:
             student.group = group
-            student.save()
+            self.changed_students[student.id] = student
 
         self.stats[status].append(status_msg)
 
+    def write_data(self):
+        """ write all changes and update the exam marks of students
+        with changed exercises """
+        with models.defer_mark_recalculation():
+            models.Exercise.objects.bulk_create(self.new_exercises)
+            models.Exercise.objects.bulk_update(
+                list(self.changed_exercises.values()), ['points', 'group'])
+            models.Student.objects.bulk_update(
+                list(self.changed_students.values()), ['group'])
+            models.add_total_points(self.point_deltas)
+            models.mark_students_dirty(self.marks_changed)
+
 import_exercises = staff_member_required(ImportExercisesView.as_view())
 
 
@@ -153,14 +279,30 @@ class ImportStudentsView(FormView):
                       'exists': [],
                       'nomatr': []
                       }
+        rows = []
         for line, row in enumerate(csvreader):
             if line == 0 and not row[0].isdigit():
                 # We seem to have a header; ignore.
                 continue
-
+            rows.append(row)
+
+        # one query each for the existing students and the groups
+        matrikels = set(int(row[0]) for row in rows if row[0].isdigit())
+        existing = set(models.Student.objects
+                       .filter(matrikel__in=matrikels)
+                       .values_list('matrikel', flat=True))
+        groups = models.Group.get_groups(
+            set(int(row[5]) for row in rows if row[5].isdigit()),
+            create=True)
+
+        new_students = []
+        for row in rows:
             if row[0].isdigit():
                 matrikel = row[0]
                 status = 'new'
+                if int(matrikel) in existing:
+                    status = 'exists'
+                existing.add(int(matrikel))
             else:
                 matrikel = None
                 status = 'nomatr'
@@ -169,23 +311,20 @@ class ImportStudentsView(FormView):
             else:
                 semester = None
             if row[5].isdigit():
-                group = models.Group.get_group(int(row[5]), create=True)
+                group = groups[int(row[5])]
             else:
                 group = None
-            student = models.Student(matrikel=matrikel,
-                                     # last_name=row[1].decode('UTF-8'),
-                                     # first_name=row[2].decode('UTF-8'),
-                                     # subject=row[3].decode('UTF-8'),
-                                     last_name=row[1],
-                                     first_name=row[2],
-                                     subject=row[3],
-                                     semester=semester,
-                                     group=group)
-            try:
-                student.save()
-            except ValidationError:
-                status = 'exists'
-            self.stats[status].append(student.matrikel)
+            if status!='exists':
+                new_students.append(models.Student(matrikel=matrikel and
+                                                   int(matrikel),
+                                                   last_name=row[1],
+                                                   first_name=row[2],
+                                                   subject=row[3],
+                                                   semester=semester,
+                                                   group=group))
+            self.stats[status].append(matrikel)
+        with transaction.atomic():
+            models.Student.create_bulk(new_students)
 
         messages.info(
             self.request,
@@ -255,16 +394,8 @@ class PrintExercisesView(ListView):
         else:
             maxsheet = int(maxsheet)
             
-        try:
-            maxpoints = float(models.StaticData.objects.get(
-                    key='maxpoints').value)
-        except models.StaticData.DoesNotExist:
-            maxpoints = None
-        try:
-            models.StaticData.objects.get(key='require_etest')
-            etest_required = True
-        except models.StaticData.DoesNotExist:
-            etest_required = False
+        maxpoints = models.StaticData.get_float('maxpoints')
+        etest_required = models.StaticData.has_key('require_etest')
 
         # exclude students coming only from exam entries
         students = models.Student.objects.exclude(group=None)
@@ -283,30 +414,36 @@ class PrintExercisesView(ListView):
 
         if exclude=='inactive':
             students = students.filter(active=True)
-
-        student_data = []
-
-        for student in list(students):
-            if exclude=='empty' and not student.exercise_set.all():
-                continue
+        elif exclude=='empty':
+            students = students.filter(Exists(
+                models.Exercise.objects.filter(student=OuterRef('pk'))))
+        selected_ids = students.order_by().values('id')
+        students = list(students.annotate(etest_result=F('entrytest__result'))
+                        .with_bonus())
+
+        # points of all selected students in one pass: student -> sheet list
+        sheet_points = {}
+        for student in students:
             student.exercises = [None] * maxsheet
-            for exercise in student.exercise_set.all():
-                if exercise.sheet<=maxsheet:
-                    student.exercises[exercise.sheet-1] = exercise
-            if etest_required:
-                try:
-                    if student.entrytest.result=='fail':
-                        student.etest_fail = True
-                except models.EntryTest.DoesNotExist:
-                    student.etest_fail = True
+            sheet_points[student.id] = student.exercises
+        exercises = models.Exercise.objects \
+            .filter(student__in=selected_ids,
+                    sheet__gte=1, sheet__lte=maxsheet) \
+            .order_by() \
+            .values_list('student', 'sheet', 'points')
+        for student_id, sheet, points in exercises:
+            sheet_points[student_id][sheet-1] = points
+
+        for student in students:
+            if etest_required and student.etest_result in (None, 'fail'):
+                student.etest_fail = True
             if maxpoints:
-                student.percent = float(student.total_points()) \
+                student.percent = float(student.total_points) \
                                   / maxpoints * 100
             else:
                 student.percent = None
-            student_data.append(student)
 
-        return student_data
+        return students
 
     def get_context_data(self, **kwargs):
         context = super(PrintExercisesView, self).get_context_data(**kwargs)
@@ -366,6 +503,7 @@ class ImportExamsView(FormView):
                       }
         self.subjectcnt = 0
         self.subject = None
+        entries = []
         for linenr, row in enumerate(csvreader):
             if len(row)==0:
                 pass
@@ -373,7 +511,16 @@ class ImportExamsView(FormView):
                 self.subject = row[0][8:].strip()
                 self.subjectcnt += 1
             else:
-                self.examine_row(linenr, row)
+                entry = self.parse_row(row)
+                if entry is None:
+                    self.stats['error'].append(linenr)
+                else:
+                    entries.append((linenr, self.subject) + entry)
+
+        self.load_data(entries)
+        for entry in entries:
+            self.examine_row(*entry)
+        self.write_data()
 
         messages.info(
             self.request,
@@ -399,7 +546,8 @@ class ImportExamsView(FormView):
                     'Format error line %d' % (linenr+1))
         return super(ImportExamsView, self).form_valid(form)
 
-    def examine_row(self, linenr, row):
+    def parse_row(self, row):
+        """ (last name, first name, matrikel, resit) or None """
         try:
             name = row[1]
             first_name = row[2]
@@ -409,35 +557,64 @@ class ImportExamsView(FormView):
             else:
                 resit = None
         except (IndexError, ValueError):
-            self.stats['error'].append(linenr)
-            return
-
-        try:
-            student = models.Student.objects.get(matrikel=matr)
-        except models.Student.DoesNotExist:
+            return None
+        return (name, first_name, matr, resit)
+
+    def load_data(self, entries):
+        """ read the students and their exams of the import with two
+        queries """
+        matrikels = set(entry[4] for entry in entries)
+        self.students = {}
+        for student in models.Student.objects \
+                .filter(matrikel__in=matrikels):
+            self.students[student.matrikel] = student
+        self.exams = {}
+        for exam in models.Exam.objects \
+                .filter(examnr=self.examnr,
+                        student__matrikel__in=matrikels) \
+                .select_related('student'):
+            self.exams[exam.student.matrikel] = exam
+        self.new_students = []
+        self.new_exams = []
+        self.changed_exams = {}
+
+    def examine_row(self, linenr, subject, name, first_name, matr, resit):
+        student = self.students.get(matr)
+        if student is None:
             student = models.Student(matrikel=matr,
                                      last_name=name,
                                      first_name=first_name,
-                                     subject=self.subject)
-            student.save()
+                                     subject=subject)
+            self.students[matr] = student
+            self.new_students.append(student)
             status = 'newstud'
         else:
             status = 'new'
 
-        try:
-            exam = models.Exam.objects.get(student=student, examnr=self.examnr)
-            if exam.subject==self.subject and exam.resit==resit:
-                status = 'unchanged'
-            else:
-                status = 'updated'
-        except models.Exam.DoesNotExist:
+        exam = self.exams.get(matr)
+        if exam is None:
+            # no points yet, hence no mark to compute
             exam = models.Exam(student=student,
                                examnr=self.examnr)
-        exam.subject = self.subject
+            self.exams[matr] = exam
+            self.new_exams.append(exam)
+        elif exam.subject==subject and exam.resit==resit:
+            status = 'unchanged'
+        else:
+            status = 'updated'
+            if exam.id:
+                self.changed_exams[exam.id] = exam
+        exam.subject = subject
         exam.resit = resit
-        exam.save()
         self.stats[status].append(linenr)
 
+    def write_data(self):
+        with transaction.atomic():
+            models.Student.create_bulk(self.new_students)
+            models.Exam.objects.bulk_create(self.new_exams)
+            models.Exam.objects.bulk_update(
+                list(self.changed_exams.values()), ['subject', 'resit'])
+
 
 #     def examine_line(self, line):
 #         if line.startswith('subject:'):
@@ -511,7 +688,10 @@ class PrintExamsView(ListView):
     def get_queryset(self):
         examnr = self.request.GET.get('examnr')
         format = self.request.GET.get('format')
-        exams = models.Exam.objects.filter(examnr=examnr)
+        exams = models.Exam.objects.filter(examnr=examnr) \
+            .select_related('student')
+        if format.startswith('result'):
+            exams = exams.with_bonus()
         if format.endswith('obscured'):
             exams = exams.order_by('student__modulo_matrikel',
                                    'student__obscured_matrikel')
@@ -539,14 +719,16 @@ class PrintExamsView(ListView):
         context['examtitle'] = masterexam.title
         context['max_points'] = masterexam.max_points
         mark_ranges = []
-        if masterexam.mark_limits:
-            mark_limits = json.loads(masterexam.mark_limits)
+        mark_limits = masterexam.get_mark_limits()
+        if mark_limits:
+            mark_limits = mark_limits.descending()
             entry = mark_limits[0]
             mark_ranges.append((masterexam.max_points,
                                 entry[0], entry[1]))
             last_limit = entry[0]
             for entry in mark_limits[1:]:
-                mark_ranges.append((last_limit-.5, entry[0], entry[1]))
+                mark_ranges.append((last_limit-Decimal('.5'),
+                                    entry[0], entry[1]))
                 last_limit = entry[0]
                 if entry[1] == 4.0:
                     context['pass_points'] = entry[0]
@@ -557,16 +739,17 @@ class PrintExamsView(ListView):
         seat_map = {}
         room_out_of_seats = []
         for room in models.Room.objects.filter(examnr=examnr):
-            if room.first_seat and room.seat_map:
-                seat_map[room] = (room.first_seat, json.loads(room.seat_map))
+            seats = room.get_seat_map()
+            if room.first_seat and seats:
+                seat_map[room.id] = (room, room.first_seat, seats)
         for e in exams:
-            if e.room in seat_map:
-                (first,seats) = seat_map[e.room]
+            if e.room_id in seat_map:
+                (room,first,seats) = seat_map[e.room_id]
                 try:
                     e.seat = seats[e.number-first]
                 except IndexError:
-                    if not e.room in room_out_of_seats:
-                        room_out_of_seats.append(e.room)
+                    if not room in room_out_of_seats:
+                        room_out_of_seats.append(room)
             else:
                 e.seat = e.number
         if room_out_of_seats:
@@ -624,18 +807,33 @@ class PointGroup(object):
             self.upper = self.lower + self.step
         self.count = 0
 
-def collect_pointgroups(queryset, pointstep=2, max_points=None):
-        group = PointGroup(step=pointstep)
-        pointgroups = [group]
-        for item in queryset:
-            while item['points'] >= group.upper:
-                group = PointGroup(previous=group)
-                pointgroups.append(group)
-            group.count += item['count']
-        if max_points and group.upper > max_points:
-            del pointgroups[-1]
-            pointgroups[-1].count += group.count
-        return pointgroups
+def collect_pointgroups(bucket_counts, pointstep=2, max_points=None):
+    """ point groups from {bucket: count}, bucket = points // pointstep """
+    group = PointGroup(step=pointstep)
+    pointgroups = [group]
+    for bucket in sorted(bucket_counts):
+        while bucket*pointstep >= group.upper:
+            group = PointGroup(previous=group)
+            pointgroups.append(group)
+        group.count += bucket_counts[bucket]
+    if max_points and group.upper > max_points and len(pointgroups)>1:
+        del pointgroups[-1]
+        pointgroups[-1].count += group.count
+    return pointgroups
+
+
+def none_first(value):
+    """ sort key: None before all values (as NULL in ORDER BY) """
+    return (value is not None, value)
+
+
+def plain_points(value):
+    """ Decimal points without trailing zeros: 29.00 -> 29, 33.50 -> 33.5 """
+    if value is None:
+        return None
+    if value==value.to_integral_value():
+        return value.quantize(Decimal(1))
+    return value.normalize()
 
 
 query_exams_opt = staff_member_required(FormView.as_view(
@@ -650,72 +848,90 @@ class QueryExamsView(TemplateView):
         context = super(QueryExamsView, self).get_context_data(**kwargs)
         examnr = self.request.GET.get('examnr')
         query_examgroups = self.request.GET.get('query_examgroups')
-
-        exams = models.Exam.objects.filter(examnr=examnr)
-        examlist = exams.exclude(points=None)
+        masterexam = models.MasterExam.objects.get(id=examnr)
+        pointstep = models.StaticData.get_int('query_exam_pointstep', 2)
+
+        # one GROUP BY exam group, mark and point bucket; all counts
+        # below are summed up from it
+        counts = models.Exam.objects.filter(examnr=examnr) \
+            .annotate(bucket=Floor(F('points') / Value(Decimal(pointstep)))) \
+            .values('exam_group', 'mark', 'bucket') \
+            .order_by() \
+            .annotate(count=Count('id'))
+        examlist = []
+        missing_count = 0
+        for item in counts:
+            if item['bucket'] is None:
+                missing_count += item['count']
+            else:
+                examlist.append(item)
         context['total_count'] = self.count_apf(examlist)
-        context['missing_count'] = exams.filter(points=None).count()
+        context['missing_count'] = missing_count
 
         if query_examgroups:
             self.get_examgroups(examlist)
             context['groups_count'] = []
             for group in self.exam_groups:
-                group_query = examlist.filter(exam_group=group)
-                group_count = self.count_apf(group_query)
+                group_list = [item for item in examlist
+                              if item['exam_group']==group]
+                group_count = self.count_apf(group_list)
                 group_count['group'] = group
                 context['groups_count'].append(group_count)
 
         if not query_examgroups:
-            markcounts = examlist.values('mark').order_by('mark') \
-                .annotate(total=Count('id'))
-            context['markcounts'] = markcounts
+            markcounts = {}
+            for item in examlist:
+                markcounts[item['mark']] = \
+                    markcounts.get(item['mark'], 0) + item['count']
+            context['markcounts'] = [
+                {'mark': mark, 'total': markcounts[mark]}
+                for mark in sorted(markcounts, key=none_first)]
         else:
             context['markcounts'] = self.count_mark_groups(examlist)
 
-        pointcounts = examlist.values('points').order_by('points') \
-            .annotate(count=Count('id'))
-        masterexam = models.MasterExam.objects.get(id=examnr)
-        try:
-            pointstep = int(models.StaticData.objects.get(
-                    key='query_exam_pointstep').value)
-        except models.StaticData.DoesNotExist:
-            pointstep = 2
+        bucket_counts = {}
+        for item in examlist:
+            bucket = max(int(item['bucket']), 0)
+            bucket_counts[bucket] = \
+                bucket_counts.get(bucket, 0) + item['count']
         context['pointgroups'] = collect_pointgroups(
-            pointcounts,
+            bucket_counts,
             pointstep,
             max_points = masterexam.max_points)
         return context
 
-    def count_apf(self, queryset):
-        return {'attend': queryset.count(),
-                'pass': queryset.filter(mark__lte=4.0).count(),
-                'fail': queryset.filter(mark=5.0).count()
-                }
+    def count_apf(self, examlist):
+        """ attend/pass/fail counts of the (exam group, mark, bucket)
+        counts in examlist """
+        counts = {'attend': 0, 'pass': 0, 'fail': 0}
+        for item in examlist:
+            counts['attend'] += item['count']
+            if item['mark'] is not None and item['mark']<=4:
+                counts['pass'] += item['count']
+            elif item['mark']==5:
+                counts['fail'] += item['count']
+        return counts
 
     def get_examgroups(self, examlist):
-        query = examlist.values('exam_group').order_by('exam_group') \
-            .annotate(count=Count('id'))
-        self.exam_groups = []
-        for item in query:
-            self.exam_groups.append(item['exam_group'])
+        self.exam_groups = sorted(set(item['exam_group']
+                                      for item in examlist),
+                                  key=none_first)
 
     def count_mark_groups(self, examlist):
-        query = examlist.values('mark', 'exam_group') \
-            .order_by('mark', 'exam_group') \
-            .annotate(count=Count('id'))
         numgroups = len(self.exam_groups)
-        markcounts = [] 
-        mark_entry = {'groupcounts': [0]*numgroups}
-        for item in query:
-            if 'mark' in mark_entry and \
-                    mark_entry['mark']!=item['mark']:
-                mark_entry['total'] =  sum(mark_entry['groupcounts'])
-                markcounts.append(mark_entry)
-                mark_entry = {'groupcounts': [0]*numgroups}
-            mark_entry['mark'] = item['mark']
-            group_index = self.exam_groups.index(item['exam_group'])
-            mark_entry['groupcounts'][group_index] = item['count']
-        if 'mark' in mark_entry:
+        group_index = dict((group, i)
+                           for (i, group) in enumerate(self.exam_groups))
+        mark_entries = {}
+        for item in examlist:
+            if item['mark'] not in mark_entries:
+                mark_entries[item['mark']] = {'mark': item['mark'],
+                                              'groupcounts': [0]*numgroups}
+            mark_entry = mark_entries[item['mark']]
+            mark_entry['groupcounts'][group_index[item['exam_group']]] \
+                += item['count']
+        markcounts = []
+        for mark in sorted(mark_entries, key=none_first):
+            mark_entry = mark_entries[mark]
             mark_entry['total'] = sum(mark_entry['groupcounts'])
             markcounts.append(mark_entry)
         return markcounts
@@ -736,10 +952,7 @@ class QueryExamPartsView(TemplateView):
         context = super(QueryExamPartsView, self).get_context_data(**kwargs)
         examnr = self.request.GET.get('examnr')
         masterexam = models.MasterExam.objects.get(id=examnr)
-        if masterexam.part_points:
-            part_points = json.loads(masterexam.part_points)
-        else:
-            part_points = None
+        part_points = masterexam.get_part_points()
 
         parts = models.ExamPart.objects.filter(exam__examnr=examnr) \
             .exclude(points=None)
@@ -768,85 +981,123 @@ class QueryStudentsView(TemplateView):
 
     def get_context_data(self, **kwargs):
         context = super(QueryStudentsView, self).get_context_data(**kwargs)
+        fields = [f for f, label in forms.STUDENT_QUERY_FIELDS]
         first_field = self.request.GET.get('first_field')
+        further_fields = self.request.GET.getlist('further_fields')
         second_field = self.request.GET.get('second_field')
         only_active = self.request.GET.get('only_active')
-
-        """ cannot use
-              qset = models.Student.object
-            here, because of annotation with Exercise in Student model
-            (class StudentManager) """
-        qset = models.Student.objects.get_pure_queryset()
+        if second_field not in fields:
+            second_field = None
+        row_fields = []
+        for field in [first_field] + further_fields:
+            if field in fields and field not in row_fields \
+                    and field!=second_field:
+                row_fields.append(field)
+        if not row_fields:
+            row_fields = [fields[0]]
+
+        qset = models.Student.objects.all()
         if only_active:
             qset = qset.filter(active=True)
-        context['first_field'] = first_field
-        if second_field=='none':
-            self.make_data1(qset, first_field, context)
+        qset = self.annotate_fields(qset, row_fields + [second_field])
+        context['first_field'] = ', '.join(row_fields)
+        if second_field is None:
+            self.make_data1(qset, row_fields, context)
         else:
             context['second_field'] = second_field
-            self.make_data2(qset, first_field, second_field, context)
+            self.make_data2(qset, row_fields, second_field, context)
         return context
 
-    def make_data1(self, qset, field, context):
-        context['headline'] = [field, '&#8721;']
+    def annotate_fields(self, qset, fields):
+        """ annotate the fields that are not plain Student columns """
+        if 'bonus' in fields:
+            qset = qset.annotate(
+                bonus=models.BonusParams.get().expression())
+        if 'exam_mark' in fields:
+            try:
+                examnr = models.MasterExam.objects.get(
+                    id=self.request.GET.get('examnr'))
+            except (models.MasterExam.DoesNotExist, ValueError):
+                examnr = models.MasterExam.objects.order_by('number').last()
+            qset = qset.annotate(exam_mark=Subquery(
+                models.Exam.objects.filter(student=OuterRef('pk'),
+                                           examnr=examnr)
+                .values('final_mark')[:1]))
+        return qset
+
+    def lookup(self, field):
         if field=='group':
-            field = 'group__number'
-        qset = qset.values(field).order_by(field) \
-            .annotate(count=Count('id'))
+            return 'group__number'
+        return field
+
+    def sort_key(self, values):
+        return [none_first(v) for v in values]
+
+    def make_data1(self, qset, fields, context):
+        """ one count column for every combination of the fields,
+        in one GROUP BY """
+        lookups = [self.lookup(f) for f in fields]
+        context['headline'] = fields + ['&#8721;']
         data = []
-        for agrp in qset:
-            data.append((agrp[field], agrp['count']))
+        for d in qset.values(*lookups).order_by() \
+                .annotate(count=Count('id')):
+            data.append([d[l] for l in lookups] + [d['count']])
+        data.sort(key=lambda row: self.sort_key(row[:-1]))
         context['data'] = data
+        context['bottomline'] = ['&#8721;'] + [''] * (len(fields)-1) \
+            + [sum(row[-1] for row in data)]
+
+    def make_data2(self, qset, row_fields, column_field, context):
+        """ cross table: one row for every combination of the row fields,
+        one column per value of the column field; one GROUP BY """
+        row_lookups = [self.lookup(f) for f in row_fields]
+        column_lookup = self.lookup(column_field)
+        counts = {}                     # row key -> {column value: count}
+        columns = set()
+        for d in qset.values(*(row_lookups + [column_lookup])) \
+                .order_by().annotate(count=Count('id')):
+            key = tuple(d[l] for l in row_lookups)
+            counts.setdefault(key, {})[d[column_lookup]] = d['count']
+            columns.add(d[column_lookup])
+        columns = sorted(columns, key=lambda c: self.sort_key([c]))
+        context['headline'] = row_fields + columns + ['&#8721;']
 
-    def make_data2(self, qset, field1, field2, context):
-        context['headline'] = [field1]
-        if field1=='group':
-            field1 = 'group__number'
-        if field2=='group':
-            field2 = 'group__number'
-        qf1 = qset.values(field1).order_by(field1) \
-            .annotate(count=Count('id'))
-        qf2 = qset.values(field2).order_by(field2) \
-            .annotate(count=Count('id'))
-        field2_dict = {}
-        for (i,d) in enumerate(qf2):
-            field2_dict[d[field2]] = i
-            context['headline'].append(d[field2])
-        context['headline'].append('&#8721;')
-
-        context['data'] = []
-        for df1 in qf1:
-            line = [df1[field1]]
-            qf = qset.filter(**{field1: df1[field1]}) \
-                .values(field2).order_by(field2) \
-                .annotate(count=Count('id'))
-            counts = [0] * len(field2_dict)
-            for d in qf:
-                i = field2_dict[d[field2]]
-                counts[i] = d['count']
-            line.extend(counts)
-            line.append(df1['count'])
-            context['data'].append(line)
-
-        counts = [d['count'] for d in qf2]
-        context['bottomline'] = ['&#8721;'] + counts + [sum(counts)]
+        data = []
+        column_sums = [0] * len(columns)
+        for key in sorted(counts, key=self.sort_key):
+            line = [counts[key].get(c, 0) for c in columns]
+            for i, count in enumerate(line):
+                column_sums[i] += count
+            data.append(list(key) + line + [sum(line)])
+        context['data'] = data
+        context['bottomline'] = ['&#8721;'] + [''] * (len(row_fields)-1) \
+            + column_sums + [sum(column_sums)]
 
 query_students = staff_member_required(QueryStudentsView.as_view())
 
 
-class ImportRegistrationsView(FormView):
+class ImportRegistrationsView(ImportJobMixin, FormView):
     template_name = 'student_manager/import_registration.html'
     form_class = forms.ImportRegistrationsForm
+    job_kind = 'registrations'
+    file_field = 'file'
+    # registration rows read and written at a time
+    chunk_size = 1000
 
     def get_success_url(self):
         return self.request.GET.get('return_url', '/')
 
-    def form_valid(self, form):
-        uploaded_file = form.cleaned_data['file']
-        column_sep = str(form.cleaned_data['csv_separator'])
-        import_choice = str(form.cleaned_data['import_choice'])
-        update_choice = str(form.cleaned_data['update_choice'])
-        create_groups = form.cleaned_data['create_groups']
+    def get_import_options(self, data):
+        return {'csv_separator': str(data['csv_separator']),
+                'import_choice': str(data['import_choice']),
+                'update_choice': str(data['update_choice']),
+                'create_groups': data['create_groups']}
+
+    def import_file(self, binary_file, options):
+        column_sep = options['csv_separator']
+        import_choice = options['import_choice']
+        update_choice = options['update_choice']
+        create_groups = options['create_groups']
 
         self.stats = {'new': [],
                       'update': [],
@@ -857,18 +1108,36 @@ class ImportRegistrationsView(FormView):
                       'dupl_regist': [],
                       }
         self.worksheet_name = None
-        self.groups = []
-        self.student_dict = {}
+        self.group_translation = {}
+        self.groups = set()             # all group strings read so far
+        self.new_groups = []            # not yet translated, file order
+        self.written = {}               # matrikel -> state, see import_data
+        self.from_file = set()          # subject/semester set by import
+        self.registered = set()         # (student id, group id) written
 
         self.subject_translation = \
             models.StaticData.get_subject_transl()
-        self.read_csv(uploaded_file, column_sep)
+        table = self.read_csv(binary_file, column_sep)
         ## xls support: conversion to Studiloewe needed
-        # if not self.read_xls(uploaded_file):
-        #     self.read_csv(uploaded_file, column_sep)
-        self.group_translation = \
-            models.Group.get_group_transl(self.groups, create=create_groups)
-        self.import_data(import_choice, update_choice)
+        # table = self.read_xls(binary_file)
+        # if table is None:
+        #     table = self.read_csv(binary_file, column_sep)
+
+        # rows are parsed lazily and written in chunks, so only one chunk
+        # is in memory
+        done = 0
+        for chunk in chunked(self.parse_table(table), self.chunk_size):
+            self.student_dict = {}
+            for registration in chunk:
+                self.add_registration(*registration)
+            if self.new_groups:
+                self.group_translation.update(models.Group.get_group_transl(
+                    self.new_groups, create=create_groups))
+                self.new_groups = []
+            self.import_data(import_choice, update_choice)
+            done += len(chunk)
+            self.progress(done)
+        self.progress(done, done)
 
         if self.worksheet_name:
             messages.success(
@@ -912,7 +1181,6 @@ class ImportRegistrationsView(FormView):
                 '%d registrations for %d existing students added/updated.'  % \
                     (self.stats['regist_update'],
                      len(self.stats['update']) + len(self.stats['unchanged'])))
-        return super(ImportRegistrationsView, self).form_valid(form)
 
     def transl_subj(self, subject):
         if type(subject)==str:
@@ -945,12 +1213,14 @@ class ImportRegistrationsView(FormView):
         if type(group_str)==str:
             group_str = group_str.translate({0xa0: 32})
         if group_str not in self.groups:
-            self.groups.append(group_str)
+            self.groups.add(group_str)
+            self.new_groups.append(group_str)
         if not priority.isdigit():
             priority = None
         stud[4].append((group_str, status, priority))
 
-    def add_table(self, table):
+    def parse_table(self, table):
+        """ generator of the add_registration arguments of the rows """
         header = True
         for row in table:
             if len(row)==0:                    # ignore empty lines
@@ -960,22 +1230,14 @@ class ImportRegistrationsView(FormView):
                     continue
                 else:
                     header = False
-            self.add_registration(matrikel=row[0],
-                                  last_name=row[1],
-                                  first_name=row[2],
-                                  subject=row[4],
-                                  semester=row[6],
-                                  status=row[7],
-                                  priority=row[8],
-                                  group_str=row[9])
-
-    def read_csv(self, uploaded_file, column_sep):
-        csv_file = TextIOWrapper(uploaded_file.file, encoding='utf-8')
-        csvreader = csv.reader(csv_file, delimiter=column_sep)
-        table = []
-        for row in csvreader:
-            table.append([c for c in row])
-        self.add_table(table)
+            yield (row[0], row[1], row[2],     # matrikel, last, first name
+                   row[4], row[6],             # subject, semester
+                   row[7], row[8], row[9])     # status, priority, group
+
+    def read_csv(self, binary_file, column_sep):
+        """ generator of the rows of the csv file """
+        csv_file = TextIOWrapper(binary_file, encoding='utf-8')
+        return csv.reader(csv_file, delimiter=column_sep)
 
     def read_xls(self, file):
         NSHEAD = '{urn:schemas-microsoft-com:office:spreadsheet}'
@@ -983,7 +1245,7 @@ class ImportRegistrationsView(FormView):
         try:
             root = tree.parse(file)
         except ElementTree.ParseError:
-            return False
+            return None
         worksheet = root.find(NSHEAD+'Worksheet')
         self.worksheet_name = worksheet.attrib[NSHEAD+'Name']
         table_elem = worksheet.find(NSHEAD+'Table')
@@ -1002,32 +1264,26 @@ class ImportRegistrationsView(FormView):
                     else:
                         accu.append('')
             table.append(accu)
-        self.add_table(table)
-        return True
+        return table
 
     def import_data(self, import_choice, update_choice):
+        """ write the students and registrations of the current chunk
+        with a few queries; the registrations of a student are replaced
+        when the student is written first, rows in later chunks add to
+        them """
+        students = {}
+        for student in models.Student.objects \
+                .filter(matrikel__in=list(self.student_dict)):
+            students[student.matrikel] = student
+        new_students = []
+        changed_students = []
+        regist_students = []            # (student, registrations, state)
+        replace_regist = []
         for matrikel, stud in self.student_dict.items():
-            try:
-                student = models.Student.objects.get(matrikel=matrikel)
-                if update_choice=='none':
-                    continue
-                state = 'unchanged'
-                if update_choice in ('stud', 'all'):
-                    if not student.last_name:
-                        student.last_name = stud[0]
-                        student.first_name = stud[1]
-                        state = 'update'
-                    if not student.subject:
-                        student.subject = stud[2]
-                        student.semester = stud[3]
-                        state = 'update'
-                    if state=='update':
-                        student.save()
-                if update_choice in ('regist', 'all'):
-                    save_regist = True
-                else:
-                    save_regist = False
-            except models.Student.DoesNotExist:
+            first = matrikel not in self.written
+            state = self.written.get(matrikel)
+            student = students.get(matrikel)
+            if student is None:
                 if import_choice=='none':
                     continue
                 state = 'new'
@@ -1036,39 +1292,91 @@ class ImportRegistrationsView(FormView):
                                          first_name=stud[1],
                                          subject=stud[2],
                                          semester=stud[3])
-                student.save()
-                if import_choice=='all':
-                    save_regist = True
-                else:
-                    save_regist = False
-            self.stats[state].append(matrikel)
-
-            if save_regist:
-                # if state!='new':
-                #     models.Registration.objects.filter(student=student).delete()
-                models.Registration.objects.filter(student=student).delete()
-                count = 0
-                for regist in stud[4]:
-                    try:
-                        group = self.group_translation[regist[0]]
-                    except KeyError:
-                        self.stats['nogroup'][regist[0]] = matrikel
-                        continue
-                    registration = models.Registration(student=student,
-                                                       group=group,
-                                                       status=regist[1],
-                                                       priority=regist[2])
-                    try:
-                        registration.save()
-                    except IntegrityError:
-                        self.stats['dupl_regist'].append((matrikel,
-                                                          regist[0]))
+                new_students.append(student)
+                self.from_file.add(matrikel)
+            else:
+                if state is None:
+                    if update_choice=='none':
                         continue
-                    count += 1
-                if state=='new':
-                    self.stats['regist_new'] += count
-                else:
-                    self.stats['regist_update'] += count
+                    state = 'unchanged'
+                if state=='new' or update_choice in ('stud', 'all'):
+                    changed = False
+                    if not student.last_name:
+                        student.last_name = stud[0]
+                        student.first_name = stud[1]
+                        changed = True
+                    if matrikel in self.from_file:
+                        # merge later rows as within a chunk
+                        if not student.subject and stud[2]:
+                            student.subject = stud[2]
+                            changed = True
+                        if student.semester is None and stud[3]:
+                            student.semester = stud[3]
+                            changed = True
+                    elif not student.subject:
+                        student.subject = stud[2]
+                        student.semester = stud[3]
+                        changed = True
+                        self.from_file.add(matrikel)
+                    if changed:
+                        changed_students.append(student)
+                        if state=='unchanged':
+                            state = 'update'
+                            if not first:
+                                self.stats['unchanged'].remove(matrikel)
+                                self.stats['update'].append(matrikel)
+            if first:
+                self.stats[state].append(matrikel)
+            self.written[matrikel] = state
+
+            if state=='new':
+                save_regist = import_choice=='all'
+            else:
+                save_regist = update_choice in ('regist', 'all')
+            if save_regist:
+                if first and student.id:
+                    replace_regist.append(student.id)
+                regist_students.append((student, stud[4], state))
+
+        with transaction.atomic():
+            models.Student.create_bulk(new_students)
+            models.Student.objects.bulk_update(
+                changed_students,
+                ['last_name', 'first_name', 'subject', 'semester'])
+            models.Registration.objects \
+                .filter(student__in=replace_regist).delete()
+            models.Registration.objects.bulk_create(
+                self.make_registrations(regist_students))
+
+    def make_registrations(self, regist_students):
+        """ registration objects of the chunk without duplicates; the
+        (student, group) pairs written so far are kept in self.registered,
+        since the registrations of a student are replaced on its first
+        write """
+        registrations = []
+        for student, regists, state in regist_students:
+            count = 0
+            for regist in regists:
+                try:
+                    group = self.group_translation[regist[0]]
+                except KeyError:
+                    self.stats['nogroup'][regist[0]] = student.matrikel
+                    continue
+                if (student.id, group.id) in self.registered:
+                    self.stats['dupl_regist'].append((student.matrikel,
+                                                      regist[0]))
+                    continue
+                self.registered.add((student.id, group.id))
+                registrations.append(
+                    models.Registration(student=student, group=group,
+                                        status=regist[1],
+                                        priority=regist[2]))
+                count += 1
+            if state=='new':
+                self.stats['regist_new'] += count
+            else:
+                self.stats['regist_update'] += count
+        return registrations
 
 
 import_registrations = staff_member_required(ImportRegistrationsView.as_view())
@@ -1099,6 +1407,7 @@ class ImportEntryTestsView(FormView):
                       'error': []
         }
 
+        entries = []
         for line, row in enumerate(csvreader):
             if line == 0 and not row[0].isdigit():
                 # We seem to have a header; ignore.
@@ -1112,21 +1421,25 @@ class ImportEntryTestsView(FormView):
                     if not result:
                         # line without test result
                         continue
-                    try:
-                        student = models.Student.objects.get(matrikel=matrikel)
-                        status = self.save_etest(student, result)
-                    except models.Student.DoesNotExist:
-                        # ignore entries for students not in the database
-                        continue
+                    entries.append((matrikel, result))
                 except KeyError:
-                    status = 'error'
+                    self.stats['error'].append(line+1)
             else:
-                status = 'error'
-
-            if status=='error':
                 self.stats['error'].append(line+1)
-            elif status!=None:
+
+        self.load_data(set(entry[0] for entry in entries))
+        for matrikel, result in entries:
+            student = self.students.get(matrikel)
+            if student is None:
+                # ignore entries for students not in the database
+                continue
+            status = self.save_etest(student, result)
+            if status!=None:
                 self.stats[status].append(matrikel)
+        with transaction.atomic():
+            models.EntryTest.objects.bulk_create(self.new_etests)
+            models.EntryTest.objects.bulk_update(
+                list(self.changed_etests.values()), ['result'])
 
         if self.stats['new']:
             messages.success(
@@ -1143,21 +1456,37 @@ class ImportEntryTestsView(FormView):
                 "csv file: error in line(s) %s" % ', '.join(lst))
         return super(ImportEntryTestsView, self).form_valid(form)
 
+    def load_data(self, matrikels):
+        """ read the students and their entry tests with two queries """
+        self.students = {}
+        for student in models.Student.objects \
+                .filter(matrikel__in=matrikels):
+            self.students[student.matrikel] = student
+        self.etests = {}
+        for etest in models.EntryTest.objects \
+                .filter(student__in=list(self.students.values())):
+            self.etests[etest.student_id] = etest
+        self.new_etests = []
+        self.changed_etests = {}
+
     def save_etest(self, student, result):
-        try:
-            etest = models.EntryTest.objects.get(student=student)
+        etest = self.etests.get(student.id)
+        if etest is not None:
             # only update an etest from fail to pass
             if etest.result=='fail' and result=='pass':
                 etest.result = 'pass'
                 status = 'update'
+                if etest.id:
+                    self.changed_etests[etest.id] = etest
             else:
                 # unchanged test result
                 return None
-        except models.EntryTest.DoesNotExist:
+        else:
             etest = models.EntryTest(student=student,
                                      result=result)
+            self.etests[student.id] = etest
+            self.new_etests.append(etest)
             status = 'new'
-        etest.save()
         return status
 
     
@@ -1170,12 +1499,14 @@ class QueryRegistrationsView(TemplateView):
     def get_context_data(self, **kwargs):
         context = super(QueryRegistrationsView, self).get_context_data(**kwargs)
 
-        groups = models.Group.objects.order_by('number')
+        groups = list(models.Group.objects.order_by('number'))
         context['groups'] = groups
         groupmap = self.make_groupmap(groups)
         context['registrations'] = self.make_registration_table(groupmap)
-        context['total_line'] = self.make_total_line(groupmap)
-        context['assistent_sum'] = self.make_assistent_sum()
+        student_cnt = self.count_students()
+        context['total_line'] = self.make_total_line(groupmap, student_cnt)
+        context['assistent_sum'] = self.make_assistent_sum(groups,
+                                                           student_cnt)
         return context
 
     def make_groupmap(self, groups):
@@ -1185,36 +1516,47 @@ class QueryRegistrationsView(TemplateView):
         return groupmap
 
     def make_registration_table(self, groupmap):
-        regtab = []
+        """ registration group x assigned group, from one query """
         groupcnt = len(groupmap)
-        for group in list(groupmap.keys()):
-            regist_cnt = models.Registration.objects \
-                .filter(group__number=group) \
-                .values('student__group__number') \
-                .order_by('student__group__number') \
-                .annotate(count=Count('id'))
-            row = (groupcnt+1) * [0]
-            for d in regist_cnt:
-                if d['student__group__number']==None:
-                    i = groupcnt
-                else:
-                    i = groupmap[d['student__group__number']]
-                row[i] = d['count']
+        rows = {}
+        for group in groupmap:
+            rows[group] = (groupcnt+1) * [0]
+        regist_cnt = models.Registration.objects \
+            .values('group__number', 'student__group__number') \
+            .order_by() \
+            .annotate(count=Count('id'))
+        for d in regist_cnt:
+            row = rows.get(d['group__number'])
+            if row is None:
+                continue
+            if d['student__group__number']==None:
+                i = groupcnt
+            else:
+                i = groupmap[d['student__group__number']]
+            row[i] = d['count']
+        regtab = []
+        for group in groupmap:
+            row = rows[group]
             regtab.append([group] + row + [sum(row)])
         return regtab
 
-    def make_total_line(self, groupmap):
-        groupcnt = len(groupmap)
-        total_cnt = models.Student.objects.get_pure_queryset() \
-            .values('group__number').order_by('group__number') \
+    def count_students(self):
+        """ number of students per assigned group number (None: no group),
+        including students without registration """
+        total_cnt = models.Student.objects \
+            .values('group__number').order_by() \
             .annotate(count=Count('id'))
+        return dict((d['group__number'], d['count']) for d in total_cnt)
+
+    def make_total_line(self, groupmap, student_cnt):
+        groupcnt = len(groupmap)
         row = (groupcnt+1) * [0]
-        for d in total_cnt:
-            if d['group__number']==None:
+        for (group, count) in student_cnt.items():
+            if group==None:
                 i = groupcnt
             else:
-                i = groupmap[d['group__number']]
-            row[i] = d['count']
+                i = groupmap[group]
+            row[i] = count
         return ['total'] + row + [sum(row)]
 
     class AssistList:
@@ -1241,20 +1583,13 @@ class QueryRegistrationsView(TemplateView):
                 self.name_dict[name] = a
             # self.group_dict[group] = a
 
-    def make_assistent_sum(self):
+    def make_assistent_sum(self, groups, student_cnt):
         assist_list = self.AssistList()
-        group_list = models.Group.objects.all().order_by('number')
-        for g in group_list:
+        for g in groups:
             if g.assistent:
                 assist_list.add(g.assistent, g.number)
-        query = models.Student.objects.get_pure_queryset() \
-            .values('group__assistent').order_by('group__assistent') \
-            .annotate(count=Count('id'))
-        for e in query:
-            name = e['group__assistent']
-            if name:
-                a = assist_list.name_dict[name]
-                a.add_students(e['count'])
+                assist_list.name_dict[g.assistent] \
+                    .add_students(student_cnt.get(g.number, 0))
         assist_sum = []
         for a in list(assist_list.name_dict.values()):
             assist_sum.append([a.name, a.groups, a.students])
@@ -1318,28 +1653,19 @@ class ExportStudentsView(FormView):
         else:
             filename = 'studenten.csv'
 
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = \
-            'attachment; filename="%s"' % filename
-
         if export_choice=='group':
             qset = models.Student.objects.filter(group=group)
         else:
             qset = models.Student.objects.all()
         if only_active:
             qset = qset.filter(active=True)
-        qset = qset.order_by('last_name', 'first_name')
-        writer = csv.writer(response, delimiter=';')
-        writer.writerow(['Matrikel', 'Name', 'Vorname',
-                         'Fach', 'Semester', 'Gruppe'])
-        for student in qset:
-            writer.writerow([student.matrikel,
-                             student.last_name,
-                             student.first_name,
-                             student.subject,
-                             student.semester, 
-                             student.group])
-        return response
+        qset = qset.order_by('last_name', 'first_name') \
+            .values_list('matrikel', 'last_name', 'first_name',
+                         'subject', 'semester', 'group__number')
+        return csv_response(
+            filename,
+            ['Matrikel', 'Name', 'Vorname', 'Fach', 'Semester', 'Gruppe'],
+            qset.iterator(chunk_size=2000))
 
 export_students = staff_member_required(ExportStudentsView.as_view())
 
@@ -1397,7 +1723,8 @@ def save_exercise_results(request, queryset=None):
             for form in formset:
                 form.sheet = sheet_form.cleaned_data['sheet']
             if formset.is_valid():
-                formset.save()
+                with models.defer_mark_recalculation():
+                    formset.save()
                 messages.success(request, 'Exercises updated.')
                 return HttpResponseRedirect(
                     reverse('admin:student_manager_group_changelist'))
@@ -1416,41 +1743,81 @@ def save_exercise_results(request, queryset=None):
 class QueryExerciseView(TemplateView):
     template_name = 'student_manager/query_exercise.html'
 
+    class Cell:
+        """ submissions of one sheet (in one group) """
+        def __init__(self, active_students):
+            self.active_students = active_students
+            self.count = 0
+            self.active = 0
+            self.point_sum = 0
+            self.distribution = {}
+
+        def add(self, points, count, active):
+            self.count += count
+            self.active += active
+            self.point_sum += points * count
+            self.distribution[points] = \
+                self.distribution.get(points, 0) + count
+
+        def average(self):
+            if self.count:
+                return self.point_sum / self.count
+
+        def share(self):
+            """ percentage of the active students that submitted """
+            if self.active_students:
+                return 100.0 * self.active / self.active_students
+
+        def distribution_text(self):
+            return ', '.join('%g: %d' % (points, count)
+                             for (points, count)
+                             in sorted(self.distribution.items()))
+
     def get_context_data(self, **kwargs):
         self.context = super(QueryExerciseView, self).get_context_data(**kwargs)
-        self.count_total()
-        groups = models.Group.objects.order_by('number')
-        self.count_by_group(groups)
+        # one GROUP BY group, sheet, points; counts, averages and
+        # distributions are summed up from it
+        ex_cnt = models.Exercise.objects \
+            .values('group__number', 'sheet', 'points') \
+            .order_by() \
+            .annotate(count=Count('id'),
+                      active=Count('id', filter=Q(student__active=True)))
+        ex_cnt = list(ex_cnt)
+        active_cnt = models.Student.objects.filter(active=True) \
+            .values('group__number').order_by() \
+            .annotate(count=Count('id'))
+        active_cnt = dict((d['group__number'], d['count'])
+                          for d in active_cnt)
+        self.count_total(ex_cnt, sum(active_cnt.values()))
+        self.count_by_group(ex_cnt, active_cnt)
         return self.context
 
-    def count_by_group(self, groups):
-        tab = []
-        for group in groups:
-            ex_cnt = models.Exercise.objects \
-                .filter(group=group) \
-                .values('sheet') \
-                .order_by('sheet') \
-                .annotate(count=Count('id'))
-            ex_cnt = list(ex_cnt)
-            if not ex_cnt:
+    def count_by_group(self, ex_cnt, active_cnt):
+        rows = {}
+        for d in ex_cnt:
+            group = d['group__number']
+            if group is None:
                 continue
-            sheets = ex_cnt[-1]['sheet']
-            row = sheets * [0]
-            for d in ex_cnt:
-                s = d['sheet']
-                row[s-1] = d['count']
-            tab.append(["Gr %d" % group.number] + row)
+            if group not in rows:
+                rows[group] = {}
+            row = rows[group]
+            if d['sheet'] not in row:
+                row[d['sheet']] = self.Cell(active_cnt.get(group, 0))
+            row[d['sheet']].add(d['points'], d['count'], d['active'])
+        tab = []
+        for group in sorted(rows):
+            row = rows[group]
+            sheets = max(row)
+            tab.append(["Gr %d" % group]
+                       + [row.get(s) or self.Cell(active_cnt.get(group, 0))
+                          for s in range(1, sheets+1)])
         self.context['data_by_group'] = tab
 
-    def count_total(self):
-        total_cnt = models.Exercise.objects \
-            .values('sheet').order_by('sheet') \
-            .annotate(count=Count('id'))
-        max_sheet = max([d['sheet'] for d in total_cnt])
-        total_row = max_sheet * [0]
-        for d in total_cnt:
-            s = d['sheet']
-            total_row[s-1] = d['count']
+    def count_total(self, ex_cnt, active_students):
+        max_sheet = max([d['sheet'] for d in ex_cnt] or [0])
+        total_row = [self.Cell(active_students) for i in range(max_sheet)]
+        for d in ex_cnt:
+            total_row[d['sheet']-1].add(d['points'], d['count'], d['active'])
         self.context['total'] = total_row
         head = [i+1 for i in range(max_sheet)]
         self.context['head'] = ['sheets'] + head
@@ -1486,62 +1853,55 @@ class QuerySpecialView(TemplateView):
         context['data'] = self.data
         return context
 
+    def subject_field(self):
+        if self.subject_from=='exam':
+            return 'subject'
+        return 'student__subject'
+
+    def count_if(self, q, field='id', distinct=False):
+        """ conditional count for aggregate(); empty q: count all """
+        if q:
+            return Count(field, distinct=distinct, filter=q)
+        return Count(field, distinct=distinct)
+
+    def percentage(self, part, total):
+        if total>0:
+            rel = Decimal('100.')*part/total
+            return rel.quantize(Decimal('99.0'))        # round to 1 decimal place
+        return 0
+
     def mkque_exam_both(self):
         self.infotext = "Results for both exams: figures are 'pass' / 'total'; " \
                         + "column 'jointly' counts each student only once" \
                         + f'; subject from {self.subject_from}'
 
-        exams_all = models.Exam.objects.all()
-
-        queries = {
-            'all': exams_all,
-            'sem12': exams_all.filter(student__semester__lte=2)
-        }
-        if self.subject_from=='exam':
-            queries['fk6'] = exams_all.filter(subject__in=('ET','IT','WIng','Kombi ET'))
-        else:
-            queries['fk6'] = exams_all.filter(student__subject__in=('ET','IT','WIng','Kombi ET'))
-
-        queries['fk6sem12'] = queries['fk6'].filter(student__semester__lte=2)
+        cohorts = models.StaticData.get_cohorts('exam_both')
+        subject_field = self.subject_field()
+        aggregates = {}
+        for (c, cohort) in enumerate(cohorts):
+            q = cohort.q(subject_field)
+            for i in (1,2):
+                aggregates['pass_%d_%d' % (c,i)] = self.count_if(
+                    q & Q(examnr__number=i, mark__lte=4.0))
+                aggregates['tot_%d_%d' % (c,i)] = self.count_if(
+                    q & Q(examnr__number=i, mark__lte=5.0))
+            aggregates['pass_%d' % c] = self.count_if(
+                q & Q(mark__lte=4.0), 'student', distinct=True)
+            aggregates['tot_%d' % c] = self.count_if(
+                q & Q(mark__lte=5.0), 'student', distinct=True)
+        counts = models.Exam.objects.aggregate(**aggregates)
 
         self.headline = ['group','exam 1','%','exam 2','%','jointly','%']
         self.data = []
-
-        for (group, description) in (
-                ('all','all'), ('fk6','FK6'), ('sem12','1st year all'),
-                ('fk6sem12','1st year FK6')
-        ):
-            line = [description]
-            for i in (1,2):
-                exams = queries[group].filter(examnr__number=i)
-                cnt_pass = exams.filter(mark__lte=4.0).count()
-                cnt_tot = exams.filter(mark__lte=5.0).count()
-                if cnt_tot>0:
-                    rel_pass = Decimal('100.')*cnt_pass/cnt_tot
-                    rel_pass = rel_pass.quantize(Decimal('99.0'))        # round to 1 decimal place
-                else:
-                    rel_pass = 0
+        for (c, cohort) in enumerate(cohorts):
+            line = [cohort.name]
+            for suffix in ('_%d_1' % c, '_%d_2' % c, '_%d' % c):
+                cnt_pass = counts['pass' + suffix]
+                cnt_tot = counts['tot' + suffix]
                 line.append("%d/%d" % (cnt_pass,cnt_tot))
-                line.append(rel_pass)
-            
-            exams_pass = queries[group].filter(mark__lte=4.0) \
-                              .values('student__matrikel') \
-                              .annotate(exam_count=Count('id'))
-            cnt_pass = exams_pass.count()
-            exams_tot = queries[group].filter(mark__lte=5.0) \
-                            .values('student__matrikel') \
-                            .annotate(exam_count=Count('id'))
-            cnt_tot = exams_tot.count()
-            if cnt_tot>0:
-                rel_pass = Decimal('100.')*cnt_pass/cnt_tot
-                rel_pass = rel_pass.quantize(Decimal('99.0'))        # round to 1 decimal place
-            else:
-                rel_pass = 0
-            line.append("%d/%d" % (cnt_pass,cnt_tot))
-            line.append(rel_pass)
-
+                line.append(self.percentage(cnt_pass, cnt_tot))
             self.data.append(line)
-            
+
     def mkque_exam_first_sem(self):
         self.infotext = 'exam results for first semester students' \
             + f' (for exam 1, subject from {self.subject_from})'
@@ -1549,145 +1909,87 @@ class QuerySpecialView(TemplateView):
         exams = models.Exam.objects \
                 .filter(examnr__number=1, student__semester__lte=1, mark__lte=5.0)
 
-        queries = {'all': exams}
-
-        if self.subject_from=='exam':
-            queries['FK6'] = exams.filter(subject__in=('ET','IT','WIng','Kombi ET'))
-            queries['ET'] = exams.filter(subject='ET')
-            queries['IT'] = exams.filter(subject='IT')
-            queries['WIng'] = exams.filter(subject='WIng')
-            queries['Kombi ET'] = exams.filter(subject='Kombi ET')
-            queries['Info'] = exams.filter(subject='Info')
-            queries['AS'] = exams.filter(subject='AS')
-            queries['Kombi Inf'] = exams.filter(subject='Kombi Inf')
-            queries['Kombi Phy'] = exams.filter(subject='Kombi Phy')
-
-        else:
-            queries['FK6'] = exams.filter(student__subject__in=('ET','IT','WIng','Kombi ET'))
-            queries['ET'] = exams.filter(student__subject='ET')
-            queries['IT'] = exams.filter(student__subject='IT')
-            queries['WIng'] = exams.filter(student__subject='WIng')
-            queries['Kombi ET'] = exams.filter(student__subject='Kombi ET')
-            queries['Info'] = exams.filter(student__subject='Info')
-            queries['AS'] = exams.filter(student__subject='AS')
-            queries['Kombi Inf'] = exams.filter(student__subject='Kombi Inf')
-            queries['Kombi Phy'] = exams.filter(student__subject='Kombi Phy')
+        cohorts = models.StaticData.get_cohorts('exam_first')
+        subject_field = self.subject_field()
+        aggregates = {}
+        for (c, cohort) in enumerate(cohorts):
+            q = cohort.q(subject_field)
+            aggregates['pass_%d' % c] = self.count_if(q & Q(mark__lte=4.0))
+            aggregates['tot_%d' % c] = self.count_if(q)
+        counts = exams.aggregate(**aggregates)
 
         self.headline = ['group','pass','total','%']
         self.data = []
+        for (c, cohort) in enumerate(cohorts):
+            cnt_pass = counts['pass_%d' % c]
+            cnt_tot = counts['tot_%d' % c]
+            self.data.append((cohort.name, cnt_pass, cnt_tot,
+                              self.percentage(cnt_pass, cnt_tot)))
 
-        for group in ('ET','IT','WIng','Kombi ET','Info','AS',
-                      'Kombi Inf','Kombi Phy','FK6','all'):
-            cnt_pass = queries[group].filter(mark__lte=4.0).count()
-            cnt_tot = queries[group].count()
-            if cnt_tot>0:
-                rel_pass = Decimal('100.')*cnt_pass/cnt_tot
-                rel_pass = rel_pass.quantize(Decimal('99.0'))              # round to 1 decimal places
-            else:
-                rel_pass = 0
-            self.data.append((group, cnt_pass, cnt_tot, rel_pass))
-        
     def mkque_exam_subject(self):
         self.infotext = 'exam pass/fail count by subject' \
             + f' (for exam 1, subject from {self.subject_from})'
 
-        exams = models.Exam.objects.filter(examnr__number=1)
-        pfdict = {}
-
-        if self.subject_from=='exam':
-            exams_pass=exams.filter(mark__lte=4.0) \
-                            .values('subject') \
-                            .order_by('subject') \
-                            .annotate(count=Count('id'))
-            exams_fail=exams.filter(mark=5.0) \
-                        .values('subject') \
-                        .order_by('subject') \
-                        .annotate(count=Count('id'))
-            for e in exams_pass:
-                pfdict[e['subject']] = (e['count'],0)
-            for e in exams_fail:
-                pf = pfdict.get(e['subject'], (0,0))
-                pfdict[e['subject']] = (pf[0],e['count'])
-        else:
-            exams_pass=exams.filter(mark__lte=4.0) \
-                            .values('student__subject') \
-                            .order_by('student__subject') \
-                            .annotate(count=Count('id'))
-            exams_fail=exams.filter(mark=5.0) \
-                        .values('student__subject') \
-                        .order_by('student__subject') \
-                        .annotate(count=Count('id'))
-            for e in exams_pass:
-                pfdict[e['student__subject']] = (e['count'],0)
-            for e in exams_fail:
-                pf = pfdict.get(e['student__subject'], (0,0))
-                pfdict[e['student__subject']] = (pf[0],e['count'])
+        subject_field = self.subject_field()
+        exams = models.Exam.objects \
+                .filter(examnr__number=1, mark__lte=5.0) \
+                .values(subject_field) \
+                .order_by(subject_field) \
+                .annotate(count_pass=Count('id', filter=Q(mark__lte=4.0)),
+                          count_fail=Count('id', filter=Q(mark=5.0)))
 
         self.data = []
-        for (s,v) in pfdict.items():
-            tot = v[0]+v[1]
-            rel = Decimal('100.')*v[0]/tot
-            rel = rel.quantize(Decimal('99.0'))                   # round to 1 decimal place
-            self.data.append((s,v[0],v[1],tot,rel))
+        for e in exams:
+            tot = e['count_pass']+e['count_fail']
+            if tot==0:
+                continue
+            self.data.append((e[subject_field], e['count_pass'],
+                              e['count_fail'], tot,
+                              self.percentage(e['count_pass'], tot)))
         self.data.sort(key=lambda x: x[0])
-        
+
         self.headline = ['subject','pass','fail','total','% pass']
-    
+
     def mkque_exam_group(self):
         self.infotext = 'exam pass/fail count by group (for exam 1)'
 
         exams = models.Exam.objects \
-                .filter(examnr__number=1)
-        
-        exams_pass=exams.filter(mark__lte=4.0) \
-                        .values('student__group__number').order_by('student__group__number') \
-                        .annotate(count=Count('id'))
-        exams_fail=exams.filter(mark=5.0) \
-                        .values('student__group__number').order_by('student__group__number') \
-                        .annotate(count=Count('id'))
-        exams_lowpass=exams.filter(mark__lte=4.0, mark__gt=3.0) \
-                        .values('student__group__number').order_by('student__group__number') \
-                        .annotate(count=Count('id'))
-
-        pfdict = {}
-        for e in exams_pass:
-            pfdict[e['student__group__number']] = (e['count'],0,0)
-        for e in exams_fail:
-            pf = pfdict.get(e['student__group__number'], (0,0,0))
-            pfdict[e['student__group__number']] = (pf[0],e['count'],0)
-        for e in exams_lowpass:
-            pf = pfdict.get(e['student__group__number'], (0,0,0))
-            pfdict[e['student__group__number']] = (pf[0],pf[1],e['count'])
+                .filter(examnr__number=1, mark__lte=5.0) \
+                .values('student__group__number') \
+                .order_by('student__group__number') \
+                .annotate(count_pass=Count('id', filter=Q(mark__lte=4.0)),
+                          count_fail=Count('id', filter=Q(mark=5.0)),
+                          count_lowpass=Count('id', filter=Q(mark__lte=4.0,
+                                                             mark__gt=3.0)))
 
         self.data = []
-        for (s,v) in pfdict.items():
-            tot = v[0]+v[1]
-            rel = Decimal('100.')*v[0]/tot
-            rel = rel.quantize(Decimal('99.0'))                   # round to 1 decimal place
-            self.data.append((s,v[0],v[1],tot,rel,v[2]))
-        # self.data.sort(key=lambda x: x[0])
-        
+        for e in exams:
+            tot = e['count_pass']+e['count_fail']
+            if tot==0:
+                continue
+            self.data.append((e['student__group__number'], e['count_pass'],
+                              e['count_fail'], tot,
+                              self.percentage(e['count_pass'], tot),
+                              e['count_lowpass']))
+
         self.headline = ['group','pass','fail','total','% pass','bad pass (>3.0)']
-    
+
     def mkque_exam_exercise(self):
         self.infotext = "exam points vs exercise points"
         exam = models.Exam.objects \
-               .annotate(exercise_points=Sum('student__exercise__points')) \
-               .filter(points__gte=25) \
+               .filter(points__gte=25, student__total_points__gte=15) \
                .values('student__matrikel',
                        'student__last_name', 'student__semester', 'points',
-                       'exercise_points') \
+                       'student__total_points') \
                .order_by('points')
 
-        exam = [e for e in exam if (e['exercise_points'] or 0)>=15]
-
         self.data = []
         for e in exam:
             self.data.append((e['student__matrikel'],
                               e['student__last_name'],
                               e['student__semester'],
                               e['points'],
-                              e['exercise_points']))
+                              plain_points(e['student__total_points'])))
         self.headline = []
         self.infotext += " (entries: %d)" % len(self.data)
 
@@ -1695,18 +1997,18 @@ class QuerySpecialView(TemplateView):
         self.infotext = "Exercises of students from different group"
 
         groups = models.Group.objects.order_by('number')
+        ex_cnt = models.Exercise.objects \
+                                .filter(group__isnull=False) \
+                                .exclude(student__group=F('group')) \
+                                .values('group', 'sheet') \
+                                .order_by('sheet') \
+                                .annotate(count=Count('id'))
+        counts = {}
+        for e in ex_cnt:
+            counts.setdefault(e['group'], []).append(e['count'])
         self.data = []
         for group in groups:
-            line = [group]
-            ex_cnt = models.Exercise.objects \
-                                    .filter(group=group) \
-                                    .exclude(student__group=group) \
-                                    .values('sheet') \
-                                    .order_by('sheet') \
-                                    .annotate(count=Count('id'))
-            for e in ex_cnt:
-                line.append(e['count'])
-            self.data.append(line)
+            self.data.append([group] + counts.get(group.id, []))
         self.headline = []
 
                 
@@ -1721,25 +2023,20 @@ class ExportEntryTestsView(FormView):
         export_choice = form.cleaned_data['export_choice']
         filename = 'entrytests.csv'
 
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = \
-            'attachment; filename="%s"' % filename
-
-        writer = csv.writer(response, delimiter=';')
-        writer.writerow(['Matrikel', 'EntryTest'])
-
         if export_choice=='all':
-            qset = models.EntryTest.objects.all()
-            for etest in qset:
-                writer.writerow([etest.student.matrikel,
-                                 etest.result])
+            rows = models.EntryTest.objects \
+                .values_list('student__matrikel', 'result') \
+                .iterator(chunk_size=2000)
         elif export_choice=='active_missing':
-            qset = models.Student.objects.filter(active=True) \
-                                         .exclude(entrytest__result='pass')
-            for student in qset:
-                writer.writerow([student.matrikel,
-                                 student.bonus()])
-        return response
+            rows = self.missing_rows()
+        return csv_response(filename, ['Matrikel', 'EntryTest'], rows)
+
+    def missing_rows(self):
+        return models.Student.objects.filter(active=True) \
+                                     .exclude(entrytest__result='pass') \
+                                     .with_bonus() \
+                                     .values_list('matrikel', 'bonus_status') \
+                                     .iterator(chunk_size=2000)
 
 export_entrytests = staff_member_required(ExportEntryTestsView.as_view())
 
@@ -1751,23 +2048,80 @@ class ExportExamResultsView(FormView):
     def form_valid(self, form):
         examnr = form.cleaned_data['examnr']
         filename = 'examresults.csv'
-
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = \
-            'attachment; filename="%s"' % filename
-
-        writer = csv.writer(response, delimiter=';')
-        writer.writerow(['Matrikel', 'Name', 'Vorname', 'Endnote'])
-
-        qset = models.Exam.objects.filter(examnr=examnr)
-        for exam in qset:
-            mark = exam.final_mark
+        qset = models.Exam.objects.filter(examnr=examnr) \
+            .values_list('student__matrikel', 'student__last_name',
+                         'student__first_name', 'final_mark')
+        return csv_response(
+            filename,
+            ['Matrikel', 'Name', 'Vorname', 'Endnote'],
+            self.result_rows(qset))
+
+    def result_rows(self, qset):
+        for matrikel, last_name, first_name, mark \
+                in qset.iterator(chunk_size=2000):
             if mark==None:
                 mark = 'NE'
-            writer.writerow([exam.student.matrikel,
-                             exam.student.last_name,
-                             exam.student.first_name,
-                             mark])
-        return response
+            yield [matrikel, last_name, first_name, mark]
 
 export_examresults = staff_member_required(ExportExamResultsView.as_view())
+
+
+class RequestMetricsView(TemplateView):
+    template_name = 'student_manager/request_metrics.html'
+
+    def post(self, request, *args, **kwargs):
+        """ write the recent aggregates now """
+        metrics.request_metrics.flush()
+        return HttpResponseRedirect(request.get_full_path())
+
+    def get_context_data(self, **kwargs):
+        context = super(RequestMetricsView, self).get_context_data(**kwargs)
+        try:
+            days = int(self.request.GET.get('days', 7))
+        except ValueError:
+            days = 7
+        since = timezone.now() - datetime.timedelta(days=days)
+        recent = metrics.request_metrics.recent()
+        context['recent'] = metrics.summarize_records(recent)
+        context['recent_count'] = len(recent)
+        context['history'] = metrics.summarize_stats(
+            models.RequestStats.objects.filter(end__gte=since))
+        context['days'] = days
+        context['interval'] = metrics.request_metrics.interval
+        return context
+
+request_metrics = staff_member_required(RequestMetricsView.as_view())
+
+
+class ImportJobView(TemplateView):
+    """ progress of an import job; when it is finished, its messages
+    are shown (once) on the page of the return url """
+    template_name = 'student_manager/import_job.html'
+
+    def get(self, request, *args, **kwargs):
+        self.job = get_object_or_404(models.ImportJob, id=kwargs['job_id'])
+        if self.job.is_finished() and not self.job.messages_shown:
+            for (level, text) in self.job.get_messages():
+                messages.add_message(request, level, text)
+            if self.job.state=='failed':
+                messages.error(request, 'Import of %s failed: %s'
+                               % (self.job.file_name,
+                                  self.job.status()['error']))
+            models.ImportJob.objects.filter(id=self.job.id) \
+                .update(messages_shown=True)
+            return HttpResponseRedirect(self.job.return_url or '/')
+        return super(ImportJobView, self).get(request, *args, **kwargs)
+
+    def get_context_data(self, **kwargs):
+        context = super(ImportJobView, self).get_context_data(**kwargs)
+        context['job'] = self.job
+        context['status'] = self.job.status()
+        return context
+
+import_job = staff_member_required(ImportJobView.as_view())
+
+
+@staff_member_required
+def import_job_status(request, job_id):
+    job = get_object_or_404(models.ImportJob, id=job_id)
+    return JsonResponse(job.status())